@@ -13,7 +13,7 @@ if __name__ == "__main__":
     from logging import getLogger
 
     import core.status
-    from core.arg_parser import process_args
+    from core.arg_parser import parser, process_args
     from core.config import cfg, init_base_cfgs
     from core.i18n import _, load_locales
     from modules import init_load_mod
@@ -26,27 +26,33 @@ if __name__ == "__main__":
         await load_locales()
         await process_args()
         init_base_cfgs()
+        if parser.db_benchmark is not None:
+            from core.db_benchmark import run_benchmark
+
+            await run_benchmark(parser.db_benchmark)
+            sys.exit(0)
 
         # isort: skip_file
         import core.api
         import core.status
-        from core.database import db_engine, db_init
+        from core.database import db_engine, db_init, db_writer
         from services.apscheduler import aps_log_warn, sched
         from services.playwright import browser_mgr
         from services.file_cache import start_file_cache_service
         from services.data_store import clean_data_store, initialize_all_stores
-        from core.expr import custom_fields, redirect_extractors
+        from core.expr import custom_fields, rate_limiter, redirect_extractors, start_rate_limiter
         from core.dispatcher import clear_handlers, process_clean, process_start
+        from core.timer import timer_wheel
+        from core.identity import identity_writer, start_identity_service
         from core.api_service import close_bots, start_bots
         from utils.aio import AsyncLoopExecutor, ThreadSafeAsyncMeta
         from utils.network import _httpx_client
 
-        # import core.identity 由 core.expr 引用
-
         await init_load_mod()
         redirect_extractors()
         await cfg.finalize_initialization()
         db_init()
+        db_writer.start()
 
         feats = []
         if cfg._default_group_list:
@@ -81,8 +87,11 @@ if __name__ == "__main__":
             await initialize_all_stores()
             await browser_mgr.start()
             await sched.start()
+            timer_wheel.start()
             with aps_log_warn():
                 await start_file_cache_service()
+                await start_rate_limiter()
+                await start_identity_service()
             core.status.all_ready.set()
             logger.info(_("main.run_start_callback"))
             await process_start()
@@ -102,12 +111,16 @@ if __name__ == "__main__":
             # persist_blacklist.clear()
             # persist_whitelist.clear()
             # extractor_registrations.clear()
+            timer_wheel.stop()
             with suppress(Exception):
                 await sched.stop()
             with suppress(Exception):
                 await _httpx_client.aclose()
             # clear_all_cache()
             await clean_data_store()
+            await rate_limiter.snapshot()
+            await identity_writer.flush()
+            await db_writer.stop()
             await gather(
                 browser_mgr.close(),
                 db_engine.dispose(),
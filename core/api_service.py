@@ -1,3 +1,4 @@
+from array import array
 from asyncio import Future, Task, create_task, current_task, gather, get_running_loop, sleep
 from collections import defaultdict
 from contextlib import suppress
@@ -7,10 +8,11 @@ from functools import partial
 from logging import getLogger
 from multiprocessing import Pipe, Process
 from secrets import token_hex
-from threading import Thread
+from threading import Lock, Thread
+from time import monotonic
 from weakref import WeakValueDictionary
 
-from aiologic import Lock, REvent, RLock
+from aiologic import REvent, RLock
 from apscheduler.triggers.calendarinterval import CalendarIntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
@@ -69,7 +71,15 @@ class BotInstance:
 
 
 class Deduplicator:
-    __slots__ = ("cache", "_lock")
+    """以事件指纹去重。指纹与时间戳存放于预分配的组相联表，按组分段加锁"""
+
+    __slots__ = ("_fingerprints", "_times", "_buckets", "_mask", "_ttl", "_locks")
+
+    WAYS = 8
+    """每组的槽数，同一指纹只会落在同一组"""
+    SLOT_BYTES = 256
+    """每个槽（指纹、时间戳与 `Bucket`）的估算占用，用于由 `cache.event.size` 换算槽数"""
+    STRIPES = 64
 
     class Bucket:
         __slots__ = ("_counts", "services", "released")
@@ -104,26 +114,41 @@ class Deduplicator:
             return bool(self._counts)
 
     def __init__(self):
-        from .cache import MemTTLCache
         from .config import cfg
 
         cache_cfg = cfg.event_cache
-        self.cache: Cache[int, Deduplicator.Bucket] = MemTTLCache(parse_size(cache_cfg["size"]), cache_cfg["ttl"])
-        self._lock = Lock()
-        super().__init__()
-
-    async def is_duplicate(self, event: BaseEvent):
-        async with self._lock:
-            if (bucket := self.cache.get(hashed := hash(event))) is None:
-                self.cache[hashed] = self.Bucket(event.bot_id)
-                return False
-
-            result = bucket.is_duplicate(event.bot_id)
-            self.cache[hashed] = bucket  # 更新缓存计数
-        return result
-
-    def services_of(self, event):
-        return b.services.copy() if (b := self.cache.get(hash(event))) else []
+        slots = 1 << max((parse_size(cache_cfg["size"]) // self.SLOT_BYTES).bit_length() - 1, self.WAYS.bit_length())
+        self._fingerprints = array("Q", bytes(8 * slots))
+        self._times = array("d", bytes(8 * slots))
+        self._buckets: list[Deduplicator.Bucket | None] = [None] * slots
+        self._mask = slots - self.WAYS
+        self._ttl = cache_cfg["ttl"]
+        self._locks = tuple(Lock() for _ in range(self.STRIPES))
+
+    def is_duplicate(self, event: BaseEvent):
+        fingerprint, now = event.fingerprint, monotonic()
+        start = fingerprint & self._mask
+        with self._locks[start // self.WAYS % self.STRIPES]:
+            expire, oldest = now - self._ttl, start
+            for i in range(start, start + self.WAYS):
+                if self._fingerprints[i] == fingerprint and self._times[i] > expire:
+                    self._times[i] = now  # 续期
+                    return self._buckets[i].is_duplicate(event.bot_id)
+                if self._times[i] < self._times[oldest]:
+                    oldest = i
+
+            # 替换组内最久未见的槽
+            self._fingerprints[oldest] = fingerprint
+            self._times[oldest] = now
+            self._buckets[oldest] = self.Bucket(event.bot_id)
+        return False
+
+    def services_of(self, event: BaseEvent):
+        fingerprint, expire = event.fingerprint, monotonic() - self._ttl
+        for i in range(start := fingerprint & self._mask, start + self.WAYS):
+            if self._fingerprints[i] == fingerprint and self._times[i] > expire and (bucket := self._buckets[i]):
+                return bucket.services.copy()
+        return []
 
 
 # region instance manager
@@ -330,7 +355,7 @@ async def event_route(bot_id, event_type, payload):
                 bot.server_ok.clear()
             create_task(process_meta(payload), eager_start=True)
         case EventCategory.CHAT:
-            if await deduplicators[payload.platform].is_duplicate(payload):
+            if deduplicators[payload.platform].is_duplicate(payload):
                 return
             create_task(process_message(payload), eager_start=True)
         case EventCategory.NOTICE:
@@ -339,7 +364,7 @@ async def event_route(bot_id, event_type, payload):
                 async with friend_conv_lock:
                     friends[payload.platform][payload.user_id].append(payload.bot_id)
 
-            if await deduplicators[payload.platform].is_duplicate(payload):
+            if deduplicators[payload.platform].is_duplicate(payload):
                 return
             create_task(process_notice(payload), eager_start=True)
         case EventCategory.REQUEST:
@@ -347,7 +372,7 @@ async def event_route(bot_id, event_type, payload):
             if cfg.cache_conv and payload.event_type is RequestEventType.GROUP and payload.sub_type is RequestSubType.INVITE:
                 _flag_mapping[payload.flag] = payload.group_id
 
-            if await deduplicators[payload.platform].is_duplicate(payload):
+            if deduplicators[payload.platform].is_duplicate(payload):
                 return
             create_task(process_request(payload), eager_start=True)
         case EventCategory.EXTERNAL:
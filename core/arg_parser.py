@@ -7,6 +7,12 @@ parser = ArgumentParser()
 parser.add_argument("--load-only", "-l", metavar="MODULE", nargs="+", help="Load only these modules.")
 parser.add_argument("--exclude", metavar="MODULE", nargs="+", help="Do not load these modules.")
 parser.add_argument("--no-db-backup", action="store_true", help="Skip database backup")
+parser.add_argument(
+    "--db-benchmark",
+    metavar="PROFILE",
+    nargs="*",
+    help="Compare SQLite performance profiles on a synthetic workload and exit. Defaults to all built-in profiles.",
+)
 module_group = parser.add_argument_group("Module Control")
 module_group.add_argument("--disable", "-d", metavar="MODULE", nargs="+", help="Disable these modules.")
 module_group.add_argument("--enable", "-e", metavar="MODULE", nargs="+", help="Enable these modules.")
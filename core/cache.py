@@ -1,7 +1,9 @@
+from asyncio import Task, create_task
 from collections.abc import Callable, Hashable  # , MutableMapping
 from functools import partial, wraps
 from logging import getLogger
 from random import choice
+from sys import getsizeof
 from time import monotonic
 from types import CoroutineType
 from typing import TYPE_CHECKING, Any, ClassVar, overload
@@ -13,7 +15,7 @@ from cachetools import Cache
 from cachetools.keys import hashkey
 from tenacity import _unset
 
-from utils.aio import async_run_func
+from utils.aio import AsyncResult, async_run_func
 from utils.asizeof import asizeof
 
 __all__ = (
@@ -25,6 +27,7 @@ __all__ = (
     "TLRUCache",
     "TTLCache",
     "async_cached",
+    "SizeEstimator",
     "MemFIFOCache",
     "MemLFUCache",
     "MemLRUCache",
@@ -65,16 +68,52 @@ class AhaCacheMixin:
         return object.__hash__(self)
 
 
+class SizeEstimator:
+    """键值对的内存估算器
+
+    键与值都是不含引用的内置类型时直接用 `sys.getsizeof` 求和；其余按键值类型分组，每 `sample_rate` 次写入用 `asizeof` 测量一次，其余返回测量结果的指数加权平均。
+    """
+
+    __slots__ = ("sample_rate", "alpha", "_estimates")
+
+    _FLAT_TYPES = frozenset((int, float, complex, bool, str, bytes, type(None)))
+
+    def __init__(self, sample_rate=32, alpha=0.25):
+        self.sample_rate = sample_rate
+        self.alpha = alpha
+        self._estimates: dict[tuple[type, type], list[float | int]] = {}
+        """值为 [估算值, 写入次数]"""
+
+    def __call__(self, key, value) -> int:
+        if key.__class__ in self._FLAT_TYPES and value.__class__ in self._FLAT_TYPES:
+            return getsizeof(key) + getsizeof(value)
+        if (estimate := self._estimates.get(types := (key.__class__, value.__class__))) is None:
+            self._estimates[types] = [size := asizeof(key, value), 1]
+            return size
+        if estimate[1] % self.sample_rate:
+            estimate[1] += 1
+            return int(estimate[0])
+        estimate[0] += self.alpha * ((size := asizeof(key, value)) - estimate[0])
+        estimate[1] += 1
+        return size
+
+
 class MemoryCacheMixin:
+    """以字节数限制容量的缓存
+
+    `sizeof` 接受键与值，返回其占用的字节数，默认为 `SizeEstimator`。
+    """
+
     INIT_MEM_SIZE: ClassVar[int]
     ADDITIONAL_PER_ITEM_MEM_SIZE: ClassVar[int]
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, sizeof: Callable[[Any, Any], int] = None, **kwargs):
         super().__init__(*args, getsizeof=asizeof, **kwargs)
         self._Cache__currsize = self.INIT_MEM_SIZE
+        self._sizeof = sizeof or SizeEstimator()
 
     def __setitem(self, key, value):
-        if (size := asizeof(key, value) + self.ADDITIONAL_PER_ITEM_MEM_SIZE) > self._Cache__maxsize:
+        if (size := self._sizeof(key, value) + self.ADDITIONAL_PER_ITEM_MEM_SIZE) > self._Cache__maxsize:
             raise ValueError("value too large")
         if key not in self._Cache__data:
             while self._Cache__currsize + size > self._Cache__maxsize:
@@ -172,21 +211,47 @@ if TYPE_CHECKING:
 
 def async_cached(cache: Cache, key=None, lock=None, ignore=None, func=None):
     """
+    同一缓存键的并发调用只执行一次被装饰函数，其余调用等待其结果；不同键的调用互不阻塞。
+
     被装饰的函数增加了两个 kwargs：
-        cache_read: 调用时查询缓存，默认为 True。
+        cache_read: 调用时查询缓存，默认为 True。为 False 时也不会等待进行中的调用。
         cache_key: 调用时临时更换缓存键生成器。
 
     Args:
         cache: 缓存器。
         key: 缓存键生成器。
+        lock: 保护缓存器读写的锁，多个函数共用缓存器时应传入同一把锁。等待被装饰函数时不会持有。
         ignore: 接受被装饰函数返回值、位置与关键字参数，返回值的 bool 为 True 时本次调用结果不写入缓存。
     """
     if lock is None:
         lock = Lock()
 
     def decorator[T: Callable](func: T) -> T:
+        pending: dict[Hashable, AsyncResult] = {}
+        tasks: set[Task] = set()
+
+        async def compute(cache_key, args, kwargs):
+            result = await func(*args, **kwargs)
+            if not ignore or not await async_run_func(ignore, result, *args, **kwargs):
+                async with lock:
+                    cache[cache_key] = result
+            return result
+
+        async def fill(cache_key, flight: AsyncResult, args, kwargs):
+            # 只有共享的计算会写入 `pending` 与缓存
+            try:
+                result = await compute(cache_key, args, kwargs)
+            except BaseException as e:
+                pending.pop(cache_key, None)
+                flight.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+            else:
+                pending.pop(cache_key, None)
+                flight.set_result(result)
+
         @wraps(func)
-        async def wrapper(*args, __func=func, __lock=lock, **kwargs) -> T:
+        async def wrapper(*args, **kwargs) -> T:
             cache_read = kwargs.pop("cache_read", True)
             cache_key = kwargs.pop("cache_key", None)
 
@@ -197,14 +262,17 @@ def async_cached(cache: Cache, key=None, lock=None, ignore=None, func=None):
             else:
                 cache_key = hashkey(*args, **kwargs)
 
-            async with __lock:
-                if cache_read and (result := cache.get(cache_key, _unset)) is not _unset:
-                    return result
+            if not cache_read:
+                return await compute(cache_key, args, kwargs)
 
-                result = await __func(*args, **kwargs)
-                if not ignore or not await async_run_func(ignore, result, *args, **kwargs):
-                    cache[cache_key] = result
-            return result
+            async with lock:
+                if (result := cache.get(cache_key, _unset)) is not _unset:
+                    return result
+            if (flight := pending.setdefault(cache_key, new := AsyncResult())) is new:
+                # 计算交给不属于任何调用者的任务，发起者被取消时不会连带其他等待者
+                tasks.add(task := create_task(fill(cache_key, flight, args, kwargs)))
+                task.add_done_callback(tasks.discard)
+            return await flight
 
         return wrapper
 
@@ -320,8 +388,8 @@ class MemFIFOCache(MemoryCacheMixin, FIFOCache):
     INIT_MEM_SIZE = 840
     ADDITIONAL_PER_ITEM_MEM_SIZE = 253
 
-    def __init__(self, maxsize: int):
-        super().__init__(maxsize)
+    def __init__(self, maxsize: int, sizeof: Callable[[Any, Any], int] = None):
+        super().__init__(maxsize, sizeof=sizeof)
 
 
 class MemLFUCache(MemoryCacheMixin, LFUCache):
@@ -330,8 +398,8 @@ class MemLFUCache(MemoryCacheMixin, LFUCache):
     INIT_MEM_SIZE = 1112
     ADDITIONAL_PER_ITEM_MEM_SIZE = 223
 
-    def __init__(self, maxsize: int):
-        super().__init__(maxsize)
+    def __init__(self, maxsize: int, sizeof: Callable[[Any, Any], int] = None):
+        super().__init__(maxsize, sizeof=sizeof)
 
 
 class MemLRUCache(MemoryCacheMixin, LRUCache):
@@ -340,8 +408,8 @@ class MemLRUCache(MemoryCacheMixin, LRUCache):
     INIT_MEM_SIZE = 840
     ADDITIONAL_PER_ITEM_MEM_SIZE = 253
 
-    def __init__(self, maxsize: int):
-        super().__init__(maxsize)
+    def __init__(self, maxsize: int, sizeof: Callable[[Any, Any], int] = None):
+        super().__init__(maxsize, sizeof=sizeof)
 
 
 class MemRRCache(MemoryCacheMixin, RRCache):
@@ -350,8 +418,8 @@ class MemRRCache(MemoryCacheMixin, RRCache):
     INIT_MEM_SIZE = 944
     ADDITIONAL_PER_ITEM_MEM_SIZE = 253
 
-    def __init__(self, maxsize: int, choice=choice):
-        super().__init__(maxsize, choice)
+    def __init__(self, maxsize: int, choice=choice, sizeof: Callable[[Any, Any], int] = None):
+        super().__init__(maxsize, choice, sizeof=sizeof)
 
 
 class MemTTLCache(MemoryCacheMixin, TTLCache):
@@ -360,8 +428,10 @@ class MemTTLCache(MemoryCacheMixin, TTLCache):
     INIT_MEM_SIZE = 1584
     ADDITIONAL_PER_ITEM_MEM_SIZE = 335
 
-    def __init__(self, maxsize: int, ttl: float, timer: Callable[[], float] = monotonic):
-        super().__init__(maxsize, ttl, timer)
+    def __init__(
+        self, maxsize: int, ttl: float, timer: Callable[[], float] = monotonic, sizeof: Callable[[Any, Any], int] = None
+    ):
+        super().__init__(maxsize, ttl, timer, sizeof=sizeof)
 
 
 class MemTLRUCache(MemoryCacheMixin, TLRUCache):
@@ -370,8 +440,10 @@ class MemTLRUCache(MemoryCacheMixin, TLRUCache):
     INIT_MEM_SIZE = 1528
     ADDITIONAL_PER_ITEM_MEM_SIZE = 328
 
-    def __init__(self, maxsize: int, ttu: float, timer: Callable[[], float] = monotonic):
-        super().__init__(maxsize, ttu, timer)
+    def __init__(
+        self, maxsize: int, ttu: float, timer: Callable[[], float] = monotonic, sizeof: Callable[[Any, Any], int] = None
+    ):
+        super().__init__(maxsize, ttu, timer, sizeof=sizeof)
 
 
 """
@@ -493,43 +565,57 @@ class CronWeakKeyRRCache(CronCacheMixin, WeakKeyRRCache):
 class CronMemFIFOCache(CronCacheMixin, MemFIFOCache):
     """定时清空限制内存FIFO缓存，需要在模块初始化时就实例化"""
 
-    def __init__(self, maxsize: int, cron="0 0 * * *"):
-        super().__init__(maxsize, cron=cron)
+    def __init__(self, maxsize: int, cron="0 0 * * *", sizeof: Callable[[Any, Any], int] = None):
+        super().__init__(maxsize, cron=cron, sizeof=sizeof)
 
 
 class CronMemLFUCache(CronCacheMixin, MemLFUCache):
     """定时清空限制内存LFU缓存，需要在模块初始化时就实例化"""
 
-    def __init__(self, maxsize: int, cron="0 0 * * *"):
-        super().__init__(maxsize, cron=cron)
+    def __init__(self, maxsize: int, cron="0 0 * * *", sizeof: Callable[[Any, Any], int] = None):
+        super().__init__(maxsize, cron=cron, sizeof=sizeof)
 
 
 class CronMemLRUCache(CronCacheMixin, MemLRUCache):
     """定时清空限制内存LRU缓存，需要在模块初始化时就实例化"""
 
-    def __init__(self, maxsize: int, cron="0 0 * * *"):
-        super().__init__(maxsize, cron=cron)
+    def __init__(self, maxsize: int, cron="0 0 * * *", sizeof: Callable[[Any, Any], int] = None):
+        super().__init__(maxsize, cron=cron, sizeof=sizeof)
 
 
 class CronMemRRCache(CronCacheMixin, MemRRCache):
     """定时清空限制内存随机替换缓存，需要在模块初始化时就实例化"""
 
-    def __init__(self, maxsize: int, choice=choice, cron="0 0 * * *"):
-        super().__init__(maxsize, choice, cron=cron)
+    def __init__(self, maxsize: int, choice=choice, cron="0 0 * * *", sizeof: Callable[[Any, Any], int] = None):
+        super().__init__(maxsize, choice, cron=cron, sizeof=sizeof)
 
 
 class CronMemTTLCache(CronCacheMixin, MemTTLCache):
     """定时清空限制内存TTL缓存，需要在模块初始化时就实例化"""
 
-    def __init__(self, maxsize: int, ttl: float, timer: Callable[[], float] = monotonic, cron="0 0 * * *"):
-        super().__init__(maxsize, ttl, timer, cron=cron)
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        timer: Callable[[], float] = monotonic,
+        cron="0 0 * * *",
+        sizeof: Callable[[Any, Any], int] = None,
+    ):
+        super().__init__(maxsize, ttl, timer, cron=cron, sizeof=sizeof)
 
 
 class CronMemTLRUCache(CronCacheMixin, MemTLRUCache):
     """定时清空限制内存时间感知LRU缓存，需要在模块初始化时就实例化"""
 
-    def __init__(self, maxsize: int, ttu: float, timer: Callable[[], float] = monotonic, cron="0 0 * * *"):
-        super().__init__(maxsize, ttu, timer, cron=cron)
+    def __init__(
+        self,
+        maxsize: int,
+        ttu: float,
+        timer: Callable[[], float] = monotonic,
+        cron="0 0 * * *",
+        sizeof: Callable[[Any, Any], int] = None,
+    ):
+        super().__init__(maxsize, ttu, timer, cron=cron, sizeof=sizeof)
 
 
 """
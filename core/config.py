@@ -1027,12 +1027,19 @@ def init_base_cfgs():
     cfg.register("super", (User("QQ", "114514"),), "Super user ID.", module="aha")
     cfg.register("global_msg_prefix", "~", _("config.comment.global_msg_prefix"), True, "aha")
     database_def = CommentedMap(
-        {"uri": "sqlite+aiosqlite:///data.db", "green": "sqlite:///data.db", "backup_dir": os.path.abspath("db_backup")}
+        {
+            "uri": "sqlite+aiosqlite:///data.db",
+            "green": "sqlite:///data.db",
+            "backup_dir": os.path.abspath("db_backup"),
+            "sqlite_profile": "balanced",
+        }
     )
     database_def.yaml_set_comment_before_after_key("uri", _("config.comment.database"), 4)
     database_def.yaml_set_comment_before_after_key("green", _("config.comment.green_db"), 4)
     database_def.yaml_set_comment_before_after_key("backup_dir", _("config.comment.db_backup"), 4)
+    database_def.yaml_set_comment_before_after_key("sqlite_profile", _("config.comment.sqlite_profile"), 4)
     cfg.register("database", database_def, module="aha")
+    cfg.register("db_write_window", 5, _("config.comment.db_write_window"), module="aha")
     cfg.register("cache_conv", False, _("config.comment.cache_conv"), module="aha")
     cfg.register("memory_level", Option(("low", "medium", "high"), "medium"), _("config.comment.memory_level"), module="aha")
     cfg.register("base64_buffer", 1919810, _("config.comment.base64_buffer"), module="aha")
@@ -2,7 +2,8 @@ import gzip
 import logging
 import os
 import sys
-from collections.abc import Callable
+from asyncio import Task, create_task, current_task, sleep
+from collections.abc import Awaitable, Callable, Iterable
 from datetime import datetime
 from functools import wraps
 from pathlib import Path
@@ -11,20 +12,24 @@ from shutil import which
 from subprocess import run
 
 import sqlalchemy.sql.schema
-from sqlalchemy import BINARY, NUMERIC, create_engine, event, text
+from aiologic import SimpleQueue
+from sqlalchemy import BINARY, NUMERIC, Column, MetaData, String, Table, create_engine, delete, event, insert, select, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.engine.url import make_url
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import DeclarativeMeta, declarative_base
 from sqlalchemy.orm import DeclarativeBase, Session
+from xxhash import xxh3_128
 
 from core.arg_parser import parser
 from models.exc import DatabaseBackupError
 from utils.aha import AHA_MODULE_PATTERN, caller_aha_module
+from utils.aio import AsyncResult
 
 from .config import cfg
 from .i18n import _
 
-__all__ = ("db_engine", "dbBase", "metadata", "db_sessionmaker", "reg_once_rollback_callback")
+__all__ = ("db_engine", "dbBase", "metadata", "db_sessionmaker", "db_writer", "reg_once_rollback_callback")
 
 MODULE_AUTHOR_PATTERN = compile(r"^modules\.([^.]+)")
 DATABASEPATHS = {"database", "database.py"}
@@ -51,24 +56,246 @@ class CustomDeclarativeMeta(DeclarativeMeta):
         super().__init__(classname, bases, dict_)
 
 
+# region SQLite 性能配置
+SQLITE_PROFILES = {
+    "default": {},
+    "balanced": {
+        "synchronous": "NORMAL",
+        "cache_size": -16384,
+        "mmap_size": 67108864,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "throughput": {
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+        "wal_autocheckpoint": 4000,
+    },
+    "durable": {
+        "synchronous": "FULL",
+        "cache_size": -16384,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+_PRAGMA_PATTERN = compile(r"^\w+$")
+
+
+def sqlite_pragmas(profile: str | dict) -> dict[str, str | int]:
+    """解析性能配置：内置配置名，或 `{pragma: 值}`，其中 `base` 键可指定作为基础的内置配置"""
+    if isinstance(profile, str):
+        if (pragmas := SQLITE_PROFILES.get(profile)) is None:
+            raise ValueError(_("database.sqlite_profile.404") % profile)
+        return pragmas
+    pragmas = {**sqlite_pragmas((profile := dict(profile)).pop("base", "default")), **profile}
+    for key, value in pragmas.items():
+        if not _PRAGMA_PATTERN.match(key) or not (isinstance(value, int) or _PRAGMA_PATTERN.match(str(value))):
+            raise ValueError(_("database.sqlite_profile.invalid") % (key, value))
+    return pragmas
+
+
+def apply_sqlite_pragmas(engine: AsyncEngine | Engine, pragmas: dict[str, str | int]):
+    """在连接池每次新建连接时执行 PRAGMA"""
+    if not pragmas or engine.dialect.name != "sqlite":
+        return
+
+    def on_connect(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for key, value in pragmas.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+        cursor.close()
+
+    event.listen(engine.sync_engine if isinstance(engine, AsyncEngine) else engine, "connect", on_connect)
+
+
+# endregion
 db_engine = create_async_engine(cfg.database["uri"])
+apply_sqlite_pragmas(db_engine, sqlite_pragmas(cfg.database.get("sqlite_profile", "balanced")))
 dbBase: DeclarativeBase = declarative_base(metaclass=CustomDeclarativeMeta)
 metadata = dbBase.metadata
 db_sessionmaker = async_sessionmaker(bind=db_engine)
 
 
+# region 单写者
+class GroupCommitWriter:
+    """SQLite 同一时刻只允许一个写者，各处各自提交只会互相等锁。
+
+    写操作以 `async op(session)` 的形式提交，由唯一的写任务在 `window` 秒内收集后于同一事务中执行并提交一次。
+    某个操作失败时回滚整批，再逐个单独重试，因此操作除数据库外不应有副作用。读取不经过本类。
+    未启动或非 SQLite 时直接在独立会话中执行。线程安全。
+    """
+
+    __slots__ = ("window", "max_batch", "_queue", "_task", "_detached")
+
+    def __init__(self, window=0.005, max_batch=256):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = SimpleQueue()
+        self._task: Task = None
+        self._detached: set[Task] = set()
+
+    async def submit[T](self, op: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        """提交写操作，在其所在批次提交后返回操作的返回值"""
+        if self._task is None:
+            return (await self._execute((op,)))[0]
+        self._queue.put((result := AsyncResult(), op))
+        return await result
+
+    def submit_nowait(self, op: Callable[[AsyncSession], Awaitable]):
+        """提交写操作但不等待，失败只记录日志。调用方自身持有写事务时须用本方法，否则会与写入任务互相等锁"""
+        self._detached.add(task := create_task(self._submit_detached(op)))
+        task.add_done_callback(self._detached.discard)
+
+    async def _submit_detached(self, op: Callable[[AsyncSession], Awaitable]):
+        try:
+            await self.submit(op)
+        except Exception:
+            _logger.exception(_("database.write_error"))
+
+    @staticmethod
+    async def _execute(ops: Iterable[Callable[[AsyncSession], Awaitable]]):
+        # 显式回滚以触发 `reg_once_rollback_callback`
+        async with db_sessionmaker() as session:
+            try:
+                results = [await op(session) for op in ops]
+                await session.commit()
+            except BaseException:
+                await session.rollback()
+                raise
+        return results
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.async_get()]
+                if self.window:
+                    await sleep(self.window)
+                while len(batch) < self.max_batch and len(self._queue):
+                    batch.append(self._queue.green_get())
+                if stopping := None in batch:
+                    batch.remove(None)
+                if batch:
+                    await self._commit(batch)
+                if stopping:
+                    return
+        except BaseException as e:
+            # 写任务意外退出时，已取出与仍在排队的操作都须得到结果，此后的提交直接执行
+            if self._task is current_task():
+                self._task = None
+            while len(self._queue):
+                if (item := self._queue.green_get()) is not None:
+                    batch.append(item)
+            for future, _ in batch:
+                future.set_exception(e)
+            raise
+
+    @classmethod
+    async def _commit(cls, batch: list[tuple[AsyncResult, Callable[[AsyncSession], Awaitable]]]):
+        try:
+            try:
+                results = await cls._execute(op for _, op in batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][0].set_exception(e)
+                    return
+            else:
+                for (future, _), result in zip(batch, results):
+                    future.set_result(result)
+                return
+
+            # 逐个重试以隔离失败的操作
+            for future, op in batch:
+                try:
+                    future.set_result((await cls._execute((op,)))[0])
+                except Exception as e:
+                    future.set_exception(e)
+        except BaseException as e:
+            # 被取消等情况下未得到结果的提交者不能一直等待，已有结果的不受影响
+            for future, _ in batch:
+                future.set_exception(e)
+            raise
+
+    def start(self):
+        if self._task is None and db_engine.dialect.name == "sqlite":
+            self.window = cfg.get("db_write_window", module="aha") / 1000
+            self._task = create_task(self._run())
+
+    async def stop(self):
+        """停止写任务，队列中剩余的操作仍会执行"""
+        if (task := self._task) is None:
+            return
+        self._task = None
+        self._queue.put(None)
+        await task
+        while len(self._queue):
+            await self._commit([self._queue.green_get() for _ in range(min(len(self._queue), self.max_batch))])
+
+
+db_writer = GroupCommitWriter()
+# endregion
+
+
+_schema_meta = MetaData()
+AhaMeta = Table("aha_meta", _schema_meta, Column("key", String(64), primary_key=True), Column("value", String(255)))
+
+
+def schema_fingerprint(*metadatas: MetaData):
+    """声明的表结构（表、列、类型、索引、约束）摘要"""
+    hasher = xxh3_128()
+    for table in sorted((table for metadata in metadatas for table in metadata.tables.values()), key=lambda t: t.fullname):
+        columns = [
+            (
+                col.name,
+                repr(col.type),
+                col.nullable,
+                col.primary_key,
+                None if col.server_default is None else str(getattr(col.server_default, "arg", col.server_default)),
+                sorted(fk.target_fullname for fk in col.foreign_keys),
+            )
+            for col in table.columns
+        ]
+        indexes = sorted((i.name or "", i.unique, tuple(col.name for col in i.columns)) for i in table.indexes)
+        constraints = sorted(
+            (type(c).__name__, c.name or "", tuple(col.name for col in getattr(c, "columns", ()))) for c in table.constraints
+        )
+        hasher.update(repr((table.fullname, columns, indexes, constraints)).encode())
+    return hasher.hexdigest()
+
+
 def db_init():
     global database_initialized
 
     from services.apscheduler import sched
 
-    with create_engine(cfg.database["green"]).begin() as conn:
+    fingerprint = schema_fingerprint(dbBase.metadata, sched.data_store.get_table_definitions())
+    with (engine := create_engine(cfg.database["green"])).begin() as conn:
         dbBase.metadata.create_all(conn)
         sched.data_store.get_table_definitions().create_all(conn)
+        _schema_meta.create_all(conn)
         if db_engine.dialect.name == "sqlite":
             conn.execute(text("PRAGMA journal_mode=WAL"))
             conn.execute(text("PRAGMA synchronous=NORMAL"))
+        stored = conn.scalar(select(AhaMeta.c.value).where(AhaMeta.c.key == "schema_fingerprint"))
+
+    # 声明的表结构自上次成功迁移后未变化时跳过反射比对
+    if stored != fingerprint:
+        _migrate()
+        with engine.begin() as conn:
+            conn.execute(delete(AhaMeta).where(AhaMeta.c.key == "schema_fingerprint"))
+            conn.execute(insert(AhaMeta).values(key="schema_fingerprint", value=fingerprint))
+    engine.dispose()
 
+    database_initialized = True
+
+    for name in {name for name in sys.modules if name == "alembic" or name.startswith("alembic.")}:
+        del sys.modules[name]
+
+
+def _migrate():
     compare_loggers = (
         logging.getLogger("alembic.autogenerate.compare"),
         logging.getLogger("alembic.autogenerate.compare.tables"),
@@ -93,11 +320,6 @@ def db_init():
             raise
         command.upgrade(alembic_cfg, "head")
 
-    database_initialized = True
-
-    for name in {name for name in sys.modules if name == "alembic" or name.startswith("alembic.")}:
-        del sys.modules[name]
-
 
 # region alembic
 _discard_log = {"Context impl SQLiteImpl.", "Will assume non-transactional DDL."}
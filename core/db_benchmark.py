@@ -0,0 +1,74 @@
+from asyncio import gather
+from logging import getLogger
+from os import urandom
+from pathlib import Path
+from random import randrange
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .config import cfg
+from .database import SQLITE_PROFILES, apply_sqlite_pragmas, sqlite_pragmas
+from .i18n import _
+
+__all__ = ("run_benchmark",)
+
+_logger = getLogger("AHA (database)")
+
+_UPSERT = text("INSERT INTO bench VALUES (:k, :v) ON CONFLICT(k) DO UPDATE SET v = excluded.v")
+_SELECT = text("SELECT v FROM bench WHERE k = :k")
+
+
+async def _bench_profile(path: Path, pragmas: dict, rows: int, reads: int, readers: int):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    apply_sqlite_pragmas(engine, {"journal_mode": "WAL", **pragmas})
+    payload = urandom(96).hex()
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE bench (k INTEGER PRIMARY KEY, v TEXT)"))
+
+        # 每条语句一次提交
+        start = perf_counter()
+        async with engine.connect() as conn:
+            for k in range(rows):
+                await conn.execute(_UPSERT, {"k": k, "v": payload})
+                await conn.commit()
+        commit = rows / (perf_counter() - start)
+
+        # 单事务批量写入
+        start = perf_counter()
+        async with engine.begin() as conn:
+            await conn.execute(_UPSERT, [{"k": k, "v": payload} for k in range(rows * 10)])
+        batch = rows * 10 / (perf_counter() - start)
+
+        # 并发点查
+        keys = [randrange(rows * 10) for _ in range(reads)]
+
+        async def reader(chunk):
+            async with engine.connect() as conn:
+                for k in chunk:
+                    await conn.scalar(_SELECT, {"k": k})
+
+        start = perf_counter()
+        await gather(*(reader(keys[i::readers]) for i in range(readers)))
+        read = reads / (perf_counter() - start)
+    finally:
+        await engine.dispose()
+    return {"commit": commit, "batch": batch, "read": read}
+
+
+async def run_benchmark(profiles: list[str] = None, rows=2000, reads=20000, readers=4):
+    """在临时数据库上以合成负载比较各 SQLite 性能配置，未指定时比较全部内置配置与当前配置"""
+    if profiles:
+        targets = {name: sqlite_pragmas(name) for name in profiles}
+    else:
+        targets = dict(SQLITE_PROFILES)
+        targets["config"] = sqlite_pragmas(cfg.database.get("sqlite_profile", "balanced"))
+
+    _logger.info(_("database.benchmark.start") % (len(targets), rows))
+    with TemporaryDirectory() as tmp:
+        for name, pragmas in targets.items():
+            result = await _bench_profile(Path(tmp) / f"{name}.db", pragmas, rows, reads, readers)
+            _logger.info(_("database.benchmark.result") % {"profile": name, **result})
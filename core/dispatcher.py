@@ -1,12 +1,14 @@
-from asyncio import create_task
+from asyncio import create_task, wait_for
 from collections import defaultdict
 from collections.abc import Callable, Container, Hashable, Sequence
-from contextvars import ContextVar
+from contextvars import Context, ContextVar, copy_context
 from copy import deepcopy
 from dataclasses import dataclass
 from functools import wraps
+from itertools import chain
 from logging import getLogger
 from re import Match, Pattern
+from threading import Lock, RLock
 from typing import TYPE_CHECKING, get_type_hints, overload
 
 from pydantic import TypeAdapter
@@ -15,9 +17,10 @@ from models.api import BaseEvent, External, Message, MetaEvent, Notice, Request
 from models.core import EventCategory
 from models.msg import MessageChain, MsgSeg
 from utils.aha import FULL_AHA_MODULE_PATTERN, caller_aha_module
-from utils.aio import ThreadSafeAsyncMeta, async_run_func
+from utils.aio import AsyncResult, ThreadSafeAsyncMeta, async_run_func
 from utils.container import DefaultIndexedDict, IndexedDict
 from utils.func import get_arg_names, get_true_func
+from utils.string import casefold_initial
 
 from . import status
 from .config import cfg
@@ -30,15 +33,31 @@ from .expr import (
     GetAttr,
     binary_expr_exists,
     build_cond,
-    cprmc,
-    cprms,
+    cmemo,
+    discriminator_fields,
+    discriminator_values,
     evaluate,
+    extract_discriminators,
+    extract_msg_initials,
+    extract_msg_literals,
     field_exists,
+    msg_str_without_prefix,
     remove_msg_seq_prefix,
 )
 from .i18n import _, create_translator
-
-__all__ = ("on_message", "on_notice", "on_request", "on_meta", "on_start", "on_cleanup", "clear_handlers", "help_items")
+from .timer import TimerHandle, timer_wheel
+
+__all__ = (
+    "on_message",
+    "on_notice",
+    "on_request",
+    "on_meta",
+    "on_start",
+    "on_cleanup",
+    "wait_for_message",
+    "clear_handlers",
+    "help_items",
+)
 
 
 # region 回调容器
@@ -56,7 +75,7 @@ class ExprAttach:
 
 
 class ExprPoolNode[Key: Hashable | Expr]:
-    __slots__ = ("key", "value", "token", "attach", "prev", "next")
+    __slots__ = ("key", "value", "token", "attach", "prev", "next", "index_key", "msg_group", "msg_keys", "unprefixed", "timer")
 
     def __init__(self, key, value, token, attach):
         self.key: Key = key
@@ -65,16 +84,145 @@ class ExprPoolNode[Key: Hashable | Expr]:
         self.attach: ExprAttach = attach
         self.prev: ExprPoolNode[Key] | None = None
         self.next: ExprPoolNode[Key] | None = None
+        self.index_key: tuple = _index_key(key)
+        self.msg_group, self.msg_keys = _msg_index(key, attach)
+        self.unprefixed: Key | None = None  # 忽略前缀的条件变体，由 `ExprPool.unprefixed` 构建
+        self.timer: TimerHandle | None = None  # `exp` 到期时移除该回调
+
+
+_ANY = object()  # 未约束该判别字段
+_LITERAL = "literal"
+_INITIAL = "initial"
+_GLOBAL_PREFIX = object()  # 使用全局前缀的回调
+
+
+def _index_key(key):
+    constraints = extract_discriminators(key)
+    return tuple(constraints.get(f, _ANY) for f in discriminator_fields)
+
+
+def _msg_index(key, attach: ExprAttach | None) -> tuple[tuple | None, tuple[Hashable, ...]]:
+    """消息内容索引
+
+    Returns:
+        第一个元素为索引分组：字面量为 `(_LITERAL, owner)`，正则首字符为 `(_INITIAL, owner, ignorecase)`；第二个元素为分组内的键。
+        `owner` 为前缀配置的归属，前缀本身在查找时读取，配置修改后无需重建索引。
+    """
+    if attach is None or attach.pre_hook:
+        return None, ()
+    if (literals := extract_msg_literals(key)) is not None:
+        return (_LITERAL, _prefix_owner(attach)), tuple(literals)
+    if (initials := extract_msg_initials(key)) is not None:
+        return (_INITIAL, _prefix_owner(attach), initials[0]), tuple(initials[1])
+    return None, ()
+
+
+def _prefix_owner(attach: ExprAttach):
+    return _GLOBAL_PREFIX if attach.use_global_prefix else attach.aha_module
+
+
+def _owner_prefix(owner):
+    return cfg.global_msg_prefix if owner is _GLOBAL_PREFIX else cfg.get_msg_prefix(owner)
+
+
+class EventProbe:
+    """单个事件查找 `ExprPool` 索引时共享的数据"""
+
+    __slots__ = ("event", "values", "_texts")
+
+    def __init__(self, event: BaseEvent):
+        self.event = event
+        self.values = discriminator_values(event)
+        self._texts: dict[str | None, str | None] = {}
+
+    def text(self, prefix: str | None):
+        """以指定前缀去除前缀后的消息文本"""
+        if (text := self._texts.get(prefix, _ANY)) is _ANY:
+            text = self._texts[prefix] = msg_str_without_prefix(self.event, prefix)
+        return text
+
+
+class _IndexBucket[Key: Hashable | Expr]:
+    __slots__ = ("nodes", "groups", "keyed", "_frozen")
+
+    def __init__(self):
+        self.nodes: list[ExprPoolNode[Key]] = []  # 未被消息内容索引的回调
+        self.groups: defaultdict[tuple, list[ExprPoolNode[Key]]] = defaultdict(list)
+        self.keyed: defaultdict[tuple[tuple, Hashable], list[ExprPoolNode[Key]]] = defaultdict(list)
+        self._frozen: _FrozenBucket[Key] | None = None
+
+    def __bool__(self):
+        return bool(self.nodes or self.groups)
+
+    @property
+    def frozen(self):
+        """桶的不可变副本，桶变化后首次读取时重建"""
+        if (frozen := self._frozen) is None:
+            frozen = self._frozen = _FrozenBucket(self)
+        return frozen
+
+    def add(self, node: ExprPoolNode[Key]):
+        self._frozen = None
+        if (group := node.msg_group) is None:
+            self.nodes.append(node)
+            return
+        self.groups[group].append(node)
+        for key in node.msg_keys:
+            self.keyed[group, key].append(node)
+
+    def remove(self, node: ExprPoolNode[Key]):
+        self._frozen = None
+        if (group := node.msg_group) is None:
+            self.nodes.remove(node)
+            return
+        (nodes := self.groups[group]).remove(node)
+        if not nodes:
+            del self.groups[group]
+        for key in node.msg_keys:
+            (nodes := self.keyed[group, key]).remove(node)
+            if not nodes:
+                del self.keyed[group, key]
+
+
+class _FrozenBucket[Key: Hashable | Expr]:
+    __slots__ = ("nodes", "groups", "keyed")
+
+    def __init__(self, bucket: _IndexBucket[Key]):
+        self.nodes = tuple(bucket.nodes)
+        self.groups = tuple((group, tuple(nodes)) for group, nodes in bucket.groups.items())
+        self.keyed = {key: tuple(nodes) for key, nodes in bucket.keyed.items()}
+
+    def lookup(self, probe: EventProbe, found: list[Sequence[ExprPoolNode[Key]]]):
+        if self.nodes:
+            found.append(self.nodes)
+        for group, nodes in self.groups:
+            text = probe.text(_owner_prefix(group[1]))
+            if group[0] is _INITIAL:
+                if not text:  # 不会匹配空字符串
+                    continue
+                if (text := casefold_initial(text[0]) if group[2] else text[0]) is None:
+                    found.append(nodes)
+                    continue
+            if nodes := self.keyed.get((group, text)):
+                found.append(nodes)
 
 
 class ExprPool[Key: Hashable | Expr](Container[tuple[Key, Callable, ExprAttach | None]]):
-    __slots__ = ("_head", "_tail", "token_map", "_key_nodes")
+    """回调池。增删在写锁内进行并作废当前快照；读取方只访问 `snapshot`，池变化后首次读取时重建并发布新快照"""
+
+    __slots__ = ("_head", "_tail", "token_map", "_key_nodes", "_buckets", "_masks", "_variant_keys", "_snapshot", "_lock")
 
     def __init__(self):
         self._head: ExprPoolNode[Key] | None = None
         self._tail: ExprPoolNode[Key] | None = None
         self.token_map: IndexedDict[int, ExprPoolNode[Key]] = IndexedDict()
         self._key_nodes: defaultdict[Key, list[ExprPoolNode[Key]]] = defaultdict(list)
+        # 判别字段索引
+        self._buckets: defaultdict[tuple, _IndexBucket[Key]] = defaultdict(_IndexBucket)
+        self._masks: defaultdict[tuple[bool, ...], int] = defaultdict(int)
+        self._variant_keys: dict[int, Key] = {}  # 条件变体的 id 到原条件
+        self._snapshot: PoolSnapshot[Key] | None = None
+        self._lock = RLock()
 
     def __len__(self):
         return len(self.token_map)
@@ -83,31 +231,68 @@ class ExprPool[Key: Hashable | Expr](Container[tuple[Key, Callable, ExprAttach |
         return key in self._key_nodes
 
     def __iter__(self):
-        current = self._tail  # 从尾部开始倒序遍历
-        while current is not None:
-            yield current.key, current.value, current.token, current.attach
-            current = current.prev
+        for node in self.snapshot.nodes:
+            yield node.key, node.value, node.token, node.attach
+
+    @property
+    def snapshot(self):
+        if (snapshot := self._snapshot) is None:
+            with self._lock:
+                if (snapshot := self._snapshot) is None:
+                    snapshot = self._snapshot = PoolSnapshot(self)
+        return snapshot
+
+    def candidates(self, probe: EventProbe, ignore_prefix=False):
+        """按判别值与消息内容筛选回调，顺序与 `__iter__` 一致。`ignore_prefix` 为 `True` 时产出忽略前缀的条件变体"""
+        found = []
+        buckets = (snapshot := self.snapshot).buckets
+        for mask in snapshot.masks:
+            if bucket := buckets.get(tuple(v if m else _ANY for v, m in zip(probe.values, mask))):
+                bucket.lookup(probe, found)
+        if not found:
+            return
+        nodes = found[0][::-1] if len(found) == 1 else sorted(chain.from_iterable(found), key=_node_token, reverse=True)
+        for node in nodes:
+            yield self.unprefixed(node) if ignore_prefix else node.key, node.value, node.token, node.attach
+
+    def unprefixed(self, node: ExprPoolNode[Key]) -> Key:
+        """`PM.prefix` 改为 `False` 的条件变体，首次使用时构建并编译，随回调一并移除"""
+        if (variant := node.unprefixed) is None:
+            with self._lock:
+                if (variant := node.unprefixed) is None:
+                    if (variant := node.key.modify(PM.prefix == False)) is not node.key:
+                        variant.compile()
+                        self._variant_keys[id(variant)] = node.key
+                    node.unprefixed = variant
+        return variant
 
     def add(self, key: Key, value: Callable, attach: ExprAttach = None):
-        node = ExprPoolNode(key, value, token := (self.token_map.key_at(-1) + 1) if self.token_map else 0, attach)
+        with self._lock:
+            node = ExprPoolNode(key, value, token := (self.token_map.key_at(-1) + 1) if self.token_map else 0, attach)
 
-        # 添加到链表尾部
-        if self._tail is None:
-            self._head = self._tail = node
-        else:
-            node.prev = self._tail
-            self._tail.next = node
-            self._tail = node
-
-        self.token_map[token] = node
-        self._key_nodes[key].append(node)
+            # 添加到链表尾部
+            if self._tail is None:
+                self._head = self._tail = node
+            else:
+                node.prev = self._tail
+                self._tail.next = node
+                self._tail = node
+
+            self.token_map[token] = node
+            self._key_nodes[key].append(node)
+            self._buckets[node.index_key].add(node)
+            self._masks[tuple(v is not _ANY for v in node.index_key)] += 1
+            self._snapshot = None
+        if exp := getattr(key, "_exp", None):
+            node.timer = timer_wheel.call_at(exp, self.remove, token)
         return token
 
-    def remove(self, token):
-        if (node := self.token_map.pop(token, None)) is None:
-            return
+    def _unlink(self, node: ExprPoolNode[Key]):
+        self._snapshot = None
+        if node.timer is not None:
+            node.timer.cancel()
 
-        # 从链中移除节点
+        # 从链中移除
         if node.prev:
             node.prev.next = node.next
         else:
@@ -117,32 +302,109 @@ class ExprPool[Key: Hashable | Expr](Container[tuple[Key, Callable, ExprAttach |
         else:
             self._tail = node.prev
 
-        # 从容器中移除
-        (nodes := self._key_nodes[node.key]).remove(node)
-        if not nodes:
-            del self._key_nodes[node.key]
+        # 从索引中移除
+        (bucket := self._buckets[node.index_key]).remove(node)
+        if not bucket:
+            del self._buckets[node.index_key]
+        self._masks[mask := tuple(v is not _ANY for v in node.index_key)] -= 1
+        if not self._masks[mask]:
+            del self._masks[mask]
+        if node.unprefixed is not None:
+            self._variant_keys.pop(id(node.unprefixed), None)
 
-    def remove_key(self, key: Key):
-        if key not in self._key_nodes:
-            return
+    def remove(self, token):
+        with self._lock:
+            if (node := self.token_map.pop(token, None)) is None:
+                return
 
-        for node in self._key_nodes.pop(key):
-            # 从链中移除
-            if node.prev:
-                node.prev.next = node.next
-            else:
-                self._head = node.next
-            if node.next:
-                node.next.prev = node.prev
-            else:
-                self._tail = node.prev
+            self._unlink(node)
+
+            # 从容器中移除
+            (nodes := self._key_nodes[node.key]).remove(node)
+            if not nodes:
+                del self._key_nodes[node.key]
+
+    def remove_key(self, key: Key):
+        with self._lock:
+            key = self._variant_keys.get(id(key), key)
+            if key not in self._key_nodes:
+                return
 
-            self.token_map.pop(node.token, None)
+            for node in self._key_nodes.pop(key):
+                self._unlink(node)
+                self.token_map.pop(node.token, None)
 
     def clear(self):
         """移除所有没有exp属性的key"""
-        for key in [key for key in self._key_nodes if not getattr(key, "_exp", None)]:
-            self.remove_key(key)
+        with self._lock:
+            for key in [key for key in self._key_nodes if not getattr(key, "_exp", None)]:
+                self.remove_key(key)
+
+
+class PoolSnapshot[Key: Hashable | Expr]:
+    """`ExprPool` 某一版本的不可变视图，发布后不再修改，分发期间无需加锁或复制"""
+
+    __slots__ = ("nodes", "masks", "buckets")
+
+    def __init__(self, pool: ExprPool[Key]):
+        nodes = []
+        current = pool._tail  # 从尾部开始倒序遍历
+        while current is not None:
+            nodes.append(current)
+            current = current.prev
+        self.nodes = tuple(nodes)
+        self.masks = tuple(pool._masks)
+        self.buckets = {index_key: bucket.frozen for index_key, bucket in pool._buckets.items()}
+
+
+def _node_token(node: ExprPoolNode):
+    return node.token
+
+
+class HandlerRegistry[K, V](DefaultIndexedDict[K, V]):
+    """回调池注册表。键变化时发布 `(参数集, 回调池)` 的不可变快照，分发只遍历 `snapshot`
+
+    所有修改都经过 `_publish`；`dict` 的 C 实现不会调用被覆盖的方法，因此其余修改方法也一并覆盖。
+    """
+
+    def __init__(self, default_factory: Callable[[], V]):
+        super().__init__(default_factory)
+        self.snapshot: tuple[tuple[K, V], ...] = ()
+
+    def _publish(self):
+        self.snapshot = tuple(self.items())
+
+    def __setitem__(self, key: K, value: V):
+        super().__setitem__(key, value)
+        self._publish()
+
+    def __delitem__(self, key: K):
+        super().__delitem__(key)
+        self._publish()
+
+    def pop(self, key, default=None):
+        result = super().pop(key, default)
+        self._publish()
+        return result
+
+    def popitem(self):
+        result = super().popitem()
+        self._publish()
+        return result
+
+    def pop_at(self, index):
+        result = super().pop_at(index)
+        self._publish()
+        return result
+
+    def setdefault(self, key: K, default: V = None) -> V:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def clear(self):
+        super().clear()
+        self._publish()
 
 
 # endregion
@@ -170,11 +432,77 @@ start_handlers: list[Callable] = []
 clean_handlers: list[Callable] = []
 help_items: list[tuple[str, Expr, str | None]] = []
 
-_message_handlers = DefaultIndexedDict(ExprPool[Expr, Callable[[MessageChain], MessageChain]])
-_notice_handlers = DefaultIndexedDict(ExprPool[Expr, None])
-_request_handlers = DefaultIndexedDict(ExprPool[Expr, None])
-_meta_handlers = DefaultIndexedDict(ExprPool[Expr, None])
-_external_handlers = DefaultIndexedDict(ExprPool[Expr, None])
+_message_handlers = HandlerRegistry(ExprPool[Expr, Callable[[MessageChain], MessageChain]])
+_notice_handlers = HandlerRegistry(ExprPool[Expr, None])
+_request_handlers = HandlerRegistry(ExprPool[Expr, None])
+_meta_handlers = HandlerRegistry(ExprPool[Expr, None])
+_external_handlers = HandlerRegistry(ExprPool[Expr, None])
+
+
+# region 会话等待
+_waiters: dict[tuple[str, str | None, str], list[tuple[Callable[[Message], bool] | None, AsyncResult, Context]]] = {}
+_waiters_lock = Lock()
+
+
+def _waiter_key(platform: str, group_id, user_id):
+    return platform, None if group_id is None else str(group_id), str(user_id)
+
+
+async def wait_for_message(
+    platform: str, user_id: str, group_id: str = None, timeout: float = 300, check: Callable[[Message], bool] = None
+) -> Message | None:
+    """等待指定会话的下一条消息，超时返回 `None`。
+    - 等待者按会话存放在字典中，不参与回调池的筛选；唤醒等待者的消息仍会照常分发给其他回调。
+    - `group_id` 为 `None` 时匹配该用户在任意会话中的消息。
+
+    Args:
+        check: 额外的筛选条件，返回 `False` 的消息不会唤醒等待者。在调用方的上下文中执行，`current_event` 为待检查的消息；抛出的异常会由本函数抛出。
+    """
+    key = _waiter_key(platform, group_id, user_id)
+    waiter = (check, result := AsyncResult(), copy_context())
+    with _waiters_lock:
+        _waiters.setdefault(key, []).append(waiter)
+    try:
+        return await wait_for(result, timeout)
+    except TimeoutError:
+        return await result if result.is_set() else None
+    finally:
+        with _waiters_lock:
+            if (waiters := _waiters.get(key)) and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del _waiters[key]
+
+
+def _run_check(check: Callable[[Message], bool], event: Message):
+    current_event.set(event)
+    return check(event)
+
+
+def _wake_waiters(event: Message):
+    keys = (_waiter_key(event.platform, event.group_id, event.user_id),)
+    if event.group_id is not None:
+        keys += (_waiter_key(event.platform, None, event.user_id),)
+    for key in keys:
+        if waiters := _waiters.get(key):
+            for check, result, ctx in tuple(waiters):
+                if result.is_set():
+                    continue
+                if check is not None:
+                    # 线程模式下同一上下文可能正被其他线程进入，须在副本中执行
+                    try:
+                        matched = ctx.copy().run(_run_check, check, event)
+                    except Exception as e:
+                        # 异常交给等待者，不影响事件的分发
+                        getLogger("AHA (waiter)").exception(e)
+                        result.set_exception(e)
+                        continue
+                    if not matched:
+                        continue
+                result.set_result(event.cow_copy())
+
+
+# endregion
 
 # region Decorators
 _message_args = {"event", "match_", "args", "localizer"}
@@ -242,7 +570,9 @@ def on_message(*conditions, exp=None, threadable=True, debug=False, pre_hook=Non
                 and (ann := getattr(ann, "__pydantic_generic_metadata__", None))
                 and (ann := ann.get("args"))
             ):
-                (conditions := And(conditions, PM.msg_chain.validateby(TypeAdapter(MessageChain[ann[0]]))))._exp = exp
+                conditions = And(conditions, PM.msg_chain.validateby(TypeAdapter(MessageChain[ann[0]])))._replace(
+                    _exp=conditions._exp
+                )
             conditions = conditions.modify(PM.limit == None)
             if cfg.debug:
                 conditions._debug = debug
@@ -264,7 +594,7 @@ def on_message(*conditions, exp=None, threadable=True, debug=False, pre_hook=Non
         cond_attach = ExprAttach(
             module, threadable, binary_expr_exists(conditions, (Apply, GetAttr, Call)), pre_hook, register_help is not None
         )
-        token = _message_handlers[args := frozenset(args)].add(conditions, func, cond_attach)
+        token = _message_handlers[args := frozenset(args)].add(conditions.compile(), func, cond_attach)
 
         func_meta = CallbackMeta(args, _message_handlers[args], conditions, func, token, cond_attach)
         if metas := getattr(func, "aha_meta", None):
@@ -319,7 +649,7 @@ def on_notice(*conditions, exp=None, threadable=True, debug=False, callback=None
                 conditions._debug = debug
 
         cond_attach = ExprAttach(module, threadable, binary_expr_exists(conditions, (Apply, GetAttr, Call)))
-        token = _notice_handlers[args := frozenset(args)].add(conditions, func, cond_attach)
+        token = _notice_handlers[args := frozenset(args)].add(conditions.compile(), func, cond_attach)
 
         func_meta = CallbackMeta(args, _notice_handlers[args], conditions, func, token, cond_attach)
         if metas := getattr(func, "aha_meta", None):
@@ -370,7 +700,7 @@ def on_request(*conditions, exp=None, threadable=True, debug=False, callback=Non
                 conditions._debug = debug
 
         cond_attach = ExprAttach(module, threadable, binary_expr_exists(conditions, (Apply, GetAttr, Call)))
-        token = _request_handlers[args := frozenset(args)].add(conditions, func, cond_attach)
+        token = _request_handlers[args := frozenset(args)].add(conditions.compile(), func, cond_attach)
 
         func_meta = CallbackMeta(args, _request_handlers[args], conditions, func, token, cond_attach)
         if metas := getattr(func, "aha_meta", None):
@@ -417,7 +747,7 @@ def on_meta(*conditions, exp=None, threadable=True, debug=False, callback=None):
         (args := [s for s in get_arg_names(func) if s in _other_args]).sort()
         conditions = build_cond(conditions, EventCategory.META, exp, debug)
         cond_attach = ExprAttach(module, threadable, binary_expr_exists(conditions, (Apply, GetAttr, Call)))
-        token = _meta_handlers[args := frozenset(args)].add(conditions, func, cond_attach)
+        token = _meta_handlers[args := frozenset(args)].add(conditions.compile(), func, cond_attach)
 
         func_meta = CallbackMeta(args, _meta_handlers[args], conditions, func, token, cond_attach)
         if metas := getattr(func, "aha_meta", None):
@@ -540,9 +870,8 @@ else:
 async def _message_evaluate(event: Message, expr, func, token, attach: ExprAttach, pool, e, m, a, l):
     copied = False
     if attach.need_isolation:
-        cprms.set(None)
-        cprmc.set(None)
-        current_event.set(event := event.model_copy(deep=True))
+        current_event.set(event := event.cow_copy())
+        cmemo.set((event, {}))
         copied = True
         if attach.pre_hook:
             event.message = await async_run_func(attach.pre_hook, event.message)
@@ -553,8 +882,8 @@ async def _message_evaluate(event: Message, expr, func, token, attach: ExprAttac
         kwargs = {}
         if e:
             if not copied:
-                event = event.model_copy(deep=True)
-            event.message = remove_msg_seq_prefix(event.message) if (cache := cprmc.get()) is None else cache
+                event = event.cow_copy()
+            event.message = remove_msg_seq_prefix(event.message)
             kwargs["event"] = event
         if m:
             kwargs["match_"] = current_match.get()
@@ -567,35 +896,34 @@ async def _message_evaluate(event: Message, expr, func, token, attach: ExprAttac
 
 @_processer
 async def process_message(event: Message, ignore_prefix=False, once: CallbackMeta = None):
-    # 删除过时缓存
-    cprmc.set(None)
-    cprms.set(None)
+    cmemo.set((event, {}))
 
     if once:
         k, pool, expr, func, token, attach = once.args, once.pool, once.condition, once.func, once.token, once.cond_attach
         e, m, a, l = "event" in k, "match_" in k, "args" in k, "localizer" in k
         current_module.set(attach.aha_module)
         if ignore_prefix:
-            expr = expr.modify(PM.prefix == False)
+            expr = pool.unprefixed(node) if (node := pool.token_map.get(token)) else expr.modify(PM.prefix == False)
         await _into_thread(_message_evaluate, attach.threadable, event, expr, func, token, attach, pool, e, m, a, l)
     else:
-        for k, pool in _message_handlers.safe_iter_items():
+        if _waiters:
+            _wake_waiters(event)
+        probe = EventProbe(event)
+        for k, pool in _message_handlers.snapshot:
             e, m, a, l = "event" in k, "match_" in k, "args" in k, "localizer" in k
-            for expr, func, token, attach in pool:
+            for expr, func, token, attach in pool.candidates(probe, ignore_prefix):
                 current_module.set(attach.aha_module)
-                if ignore_prefix:
-                    expr = expr.modify(PM.prefix == False)
                 await _into_thread(_message_evaluate, attach.threadable, event, expr, func, token, attach, pool, e, m, a, l)
 
 
 async def _notice_evaluate(event: Notice, expr, func, token, attach: ExprAttach, pool, e, l):
     current_module.set(attach.aha_module)
     if attach.need_isolation:
-        event = event.model_copy(deep=True)
+        cmemo.set((event := event.cow_copy(), {}))
     if await evaluate(event, expr, token, pool):
         kwargs = {}
         if e:
-            kwargs["event"] = event if attach.need_isolation else event.model_copy(deep=True)
+            kwargs["event"] = event if attach.need_isolation else event.cow_copy()
         if l:
             kwargs["localizer"] = create_translator(attach.aha_module, current_lang.get())
         await func(**kwargs)
@@ -603,25 +931,27 @@ async def _notice_evaluate(event: Notice, expr, func, token, attach: ExprAttach,
 
 @_processer
 async def process_notice(event: Notice, once: CallbackMeta = None):
+    cmemo.set((event, {}))
     if once:
         k, pool, expr, func, token, attach = once.args, once.pool, once.condition, once.func, once.token, once.cond_attach
         e, l = "event" in k, "localizer" in k
         await _into_thread(_notice_evaluate, attach.threadable, event, expr, func, token, attach, pool, e, l)
     else:
-        for k, pool in _notice_handlers.safe_iter_items():
+        probe = EventProbe(event)
+        for k, pool in _notice_handlers.snapshot:
             e, l = "event" in k, "localizer" in k
-            for expr, func, token, attach in pool:
+            for expr, func, token, attach in pool.candidates(probe):
                 await _into_thread(_notice_evaluate, attach.threadable, event, expr, func, token, attach, pool, e, l)
 
 
 async def _request_evaluate(event: Request, expr, func, token, attach: ExprAttach, pool, e, l):
     current_module.set(attach.aha_module)
     if attach.need_isolation:
-        event = event.model_copy(deep=True)
+        cmemo.set((event := event.cow_copy(), {}))
     if await evaluate(event, expr, token, pool):
         kwargs = {}
         if e:
-            kwargs["event"] = event if attach.need_isolation else event.model_copy(deep=True)
+            kwargs["event"] = event if attach.need_isolation else event.cow_copy()
         if l:
             kwargs["localizer"] = create_translator(attach.aha_module, current_lang.get())
         await func(**kwargs)
@@ -629,25 +959,27 @@ async def _request_evaluate(event: Request, expr, func, token, attach: ExprAttac
 
 @_processer
 async def process_request(event: Request, once: CallbackMeta = None):
+    cmemo.set((event, {}))
     if once:
         k, pool, expr, func, token, attach = once.args, once.pool, once.condition, once.func, once.token, once.cond_attach
         e, l = "event" in k, "localizer" in k
         await _into_thread(_request_evaluate, attach.threadable, event, expr, func, token, attach, pool, e, l)
     else:
-        for k, pool in _request_handlers.safe_iter_items():
+        probe = EventProbe(event)
+        for k, pool in _request_handlers.snapshot:
             e, l = "event" in k, "localizer" in k
-            for expr, func, token, attach in pool:
+            for expr, func, token, attach in pool.candidates(probe):
                 await _into_thread(_request_evaluate, attach.threadable, event, expr, func, token, attach, pool, e, l)
 
 
 async def _meta_evaluate(event: MetaEvent, expr, func, token, attach: ExprAttach, pool, e, l):
     current_module.set(attach.aha_module)
     if attach.need_isolation:
-        event = event.model_copy(deep=True)
+        cmemo.set((event := event.cow_copy(), {}))
     if await evaluate(event, expr, token, pool):
         kwargs = {}
         if e:
-            kwargs["event"] = event if attach.need_isolation else event.model_copy(deep=True)
+            kwargs["event"] = event if attach.need_isolation else event.cow_copy()
         if l:
             kwargs["localizer"] = create_translator(attach.aha_module, current_lang.get())
         await func(**kwargs)
@@ -655,14 +987,16 @@ async def _meta_evaluate(event: MetaEvent, expr, func, token, attach: ExprAttach
 
 @_processer
 async def process_meta(event: MetaEvent, once: CallbackMeta = None):
+    cmemo.set((event, {}))
     if once:
         k, pool, expr, func, token, attach = once.args, once.pool, once.condition, once.func, once.token, once.cond_attach
         e, l = "event" in k, "localizer" in k
         await _into_thread(_meta_evaluate, attach.threadable, event, expr, func, token, attach, pool, e, l)
     else:
-        for k, pool in _meta_handlers.safe_iter_items():
+        probe = EventProbe(event)
+        for k, pool in _meta_handlers.snapshot:
             e, l = "event" in k, "localizer" in k
-            for expr, func, token, attach in pool:
+            for expr, func, token, attach in pool.candidates(probe):
                 await _into_thread(_meta_evaluate, attach.threadable, event, expr, func, token, attach, pool, e, l)
 
 
@@ -671,7 +1005,7 @@ async def _external_evaluate(event: External, key, func, attach: ExprAttach, e,
     if key == event.key:
         kwargs = {}
         if e:
-            kwargs["event"] = copied_event = event.model_copy(deep=True)
+            kwargs["event"] = copied_event = event.cow_copy()
             if d:
                 kwargs["data"] = copied_event.data
         elif d:
@@ -688,7 +1022,7 @@ async def process_external(event: External, once: CallbackMeta = None):
         e, d, l = "event" in args, "data" in args, "localizer" in args
         await _into_thread(_external_evaluate, attach.threadable, event, key, func, attach, e, d, l)
     else:
-        for args, pool in _external_handlers.safe_iter_items():
+        for args, pool in _external_handlers.snapshot:
             e, d, l = "event" in args, "data" in args, "localizer" in args
             for key, func, _, attach in pool:
                 await _into_thread(_external_evaluate, attach.threadable, event, key, func, attach, e, d, l)
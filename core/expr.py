@@ -1,25 +1,45 @@
 import re
 from abc import abstractmethod
+from asyncio import Task, create_task
+from array import array
 from collections import defaultdict
 from collections.abc import Callable, Container, Hashable, Iterable, KeysView, MutableSequence, Sequence, ValuesView
 from contextlib import suppress
 from contextvars import ContextVar
 from dataclasses import dataclass, field
 from functools import partial
+from itertools import groupby
+from inspect import iscoroutinefunction
 from logging import getLogger
+from math import inf
 from pprint import pprint
-from time import localtime, strftime, time
+from threading import Lock
+from time import localtime, perf_counter_ns, strftime, time
 from types import CoroutineType, GenericAlias, UnionType
-from typing import TYPE_CHECKING, Any, Hashable, NoReturn, TypedDict, Unpack, _Final, _UnionGenericAlias
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Hashable,
+    NoReturn,
+    TypedDict,
+    Union,
+    Unpack,
+    _Final,
+    _UnionGenericAlias,
+    get_args,
+    get_origin,
+)
+from weakref import WeakValueDictionary
 
 from aiologic.meta import copies
 from cachetools import Cache
 from pydantic import TypeAdapter
 from pydantic_core._pydantic_core import ValidationError
-from sqlalchemy import Column, Float, Integer, String, insert, update
+from sqlalchemy import Column, Float, Integer, String, delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from tenacity import _unset
 
-from core.database import db_sessionmaker, dbBase
+from core.database import db_sessionmaker, db_writer, dbBase
 from core.i18n import LocalizedString
 from models.api import (
     BaseEvent,
@@ -38,10 +58,10 @@ from models.api import (
 from models.core import EventCategory, Group, User
 from models.exc import AhaExprFieldDuplicate
 from models.msg import At, MessageChain, MsgSeg, Text
-from utils.aio import async_all, async_any, async_run_func
+from utils.aio import AsyncResult, async_all, async_any, async_run_func
 from utils.container import find_first_instance, is_prefix, is_suffix
 from utils.aha import AHA_MODULE_PATTERN, caller_aha_module
-from utils.string import halfwidth
+from utils.string import halfwidth, pattern_initials
 
 from .cache import LRUCache, async_cached
 from .config import Option, cfg
@@ -113,9 +133,11 @@ __all__ = (
     "NotEqual",
     "fields",
     "evaluate",
+    "compile_expr",
     "modify_expr",
     "field_exists",
     "binary_expr_exists",
+    "intern_expr",
     "register_extractor",
 )
 
@@ -127,19 +149,33 @@ _logger = getLogger("AHA Expr")
 
 
 # region 基类/元类
+def _slot_hash(value):
+    try:
+        return hash(value)
+    except TypeError:
+        return object.__hash__(value)
+
+
 class Expr[Result]:
     """表达式基类"""
 
-    __slots__ = "_exp"
+    __slots__ = ("_exp", "_compiled", "_hash")
 
     def __init__(self):
+        # 子类须在调用前设置完所有公有字段，构造后不再修改
         self._exp = None
+        self._compiled = None
+        self._hash = self._compute_hash()
 
     def __hash__(self):
+        return self._hash
+
+    def _compute_hash(self):
+        # `_exp` 等私有字段不参与哈希
         return hash(
-            ((self.__class__, self._exp) if self._exp else (self.__class__,))
+            (self.__class__,)
             + tuple(
-                v if isinstance(v, Hashable) else object.__hash__(v)
+                _slot_hash(v)
                 for cls in self.__class__.__mro__
                 if (slots := getattr(cls, "__slots__", None))
                 for slot in ((slots,) if isinstance(slots, str) else slots)
@@ -147,6 +183,27 @@ class Expr[Result]:
             )
         )
 
+    def _replace(self, **changes):
+        """复制节点并替换部分字段，得到新节点而不修改原节点"""
+        new = object.__new__(cls := self.__class__)
+        for klass in cls.__mro__:
+            if not (slots := klass.__dict__.get("__slots__")):
+                continue
+            for slot in (slots,) if isinstance(slots, str) else slots:
+                if slot in changes:
+                    setattr(new, slot, changes.pop(slot))
+                else:
+                    with suppress(AttributeError):
+                        setattr(new, slot, klass.__dict__[slot].__get__(self, klass))
+        with suppress(AttributeError):
+            state = object.__getattribute__(self, "__dict__")
+            object.__getattribute__(new, "__dict__").update(state)
+        for key, value in changes.items():
+            setattr(new, key, value)
+        new._compiled = None
+        new._hash = new._compute_hash()
+        return new
+
     def modify(self, *overrides: BinaryExpr):
         """递归修改表达式中的指定字段，第二个操作数为 `None` 时删除该字段的表达式"""
         return modify_expr(self, *overrides)
@@ -155,6 +212,15 @@ class Expr[Result]:
         """表达式中是否包含指定字段"""
         return field_exists(self, field)
 
+    def compile(self):
+        """通过 `compile_expr` 编译表达式，`evaluate` 函数会优先使用编译结果"""
+        self._compiled = compile_expr(self)
+        return self
+
+    def _compile(self) -> tuple[Callable[[BaseEvent], Any], bool]:
+        """返回闭包与其是否为协程函数，没有特化的表达式回退到 `evaluate`"""
+        return self.evaluate, True
+
     @abstractmethod
     async def evaluate(self, event) -> Result:
         """表达式求值接口
@@ -369,9 +435,63 @@ if DEBUG and not TYPE_CHECKING:
 
 
 async def _get_field_value(field: FieldClause, event: BaseEvent):
-    if field.field.extractor is None and field.field._requires_extractor:
+    if (extractor := field.field.extractor) is None and field.field._requires_extractor:
         return True
-    return await async_run_func(field.field.extractor, event)
+    if field.field.memo:
+        return await _memoized_async(_memo_key(field.field), extractor, event)
+    return await async_run_func(extractor, event)
+
+
+# region 同一事件的结果共享
+cmemo: ContextVar[tuple[BaseEvent, dict] | None] = ContextVar("aha_extraction_memo", default=None)
+"""键为字段的 id（或附加上下文键的元组）与共享二元表达式的 id"""
+
+
+def _memo_table(event: BaseEvent) -> dict | None:
+    if (memo := cmemo.get()) is not None and memo[0] is event:
+        return memo[1]
+
+
+def _memo_key(field: Field):
+    return (id(field), field.memo()) if callable(field.memo) else id(field)
+
+
+def _memoized_sync(key: Hashable, func: Callable, event: BaseEvent):
+    if (table := _memo_table(event)) is None:
+        return func(event)
+    if (value := table.get(key, _unset)) is _unset or value.__class__ is AsyncResult:
+        value = table[key] = func(event)
+    return value
+
+
+async def _memoized_async(key: Hashable, func: Callable, event: BaseEvent):
+    if (table := _memo_table(event)) is None:
+        return await async_run_func(func, event)
+    if (value := table.get(key, _unset)) is _unset:
+        if (value := table.setdefault(key, pending := AsyncResult())) is pending:
+            # 计算交给不属于任何回调的任务，发起者被取消时不会连带其他等待者
+            _memo_tasks.add(task := create_task(_fill_memo(table, key, pending, func, event)))
+            task.add_done_callback(_memo_tasks.discard)
+    return await value if value.__class__ is AsyncResult else value
+
+
+_memo_tasks: set[Task] = set()
+
+
+async def _fill_memo(table: dict, key: Hashable, pending: AsyncResult, func: Callable, event: BaseEvent):
+    try:
+        value = await async_run_func(func, event)
+    except BaseException as e:
+        table.pop(key, None)
+        pending.set_exception(e)
+        if not isinstance(e, Exception):
+            raise
+    else:
+        table[key] = value
+        pending.set_result(value)
+
+
+# endregion
 
 
 custom_fields = []
@@ -411,6 +531,18 @@ class FieldClause[Result](Expr[Result]):
     def evaluate(self, event) -> CoroutineType[Any, Any, Result]:
         return _get_field_value(self, event)
 
+    def _compile(self):
+        # 需要注册的 extractor 在模块加载完成后才会重定向，只能在评估时读取
+        if self.field._requires_extractor or (extractor := self.field.extractor) is None:
+            return partial(_get_field_value, self), True
+        if not (memo := self.field.memo):
+            return extractor, iscoroutinefunction(extractor)
+        memoized, is_async = (_memoized_async, True) if iscoroutinefunction(extractor) else (_memoized_sync, False)
+        if not callable(memo):
+            return partial(memoized, id(self.field), extractor), is_async
+        key = id(self.field)
+        return (lambda event: memoized((key, memo()), extractor, event)), is_async
+
     def __hash__(self):
         return hash(self.name)
 
@@ -425,7 +557,7 @@ class Field:
     """字段描述符
 
     Attributes:
-        extractor: 从 `BaseEvent` 中获取值的方法。
+        extractor: 从 `BaseEvent` 中获取值的方法。返回协程的须声明为 `async def`。
         default: 生成默认表达式。若并列表达式中没有该字段 `build_cond` 会自动添加默认表达式。
         priority: 在多元表达式评估的优先级，0表示保持原顺序，越大越优先，越小越靠后。
         binary_semantics: `build_cond` 会由此将二元表达式类型转成其他二元表达式类型。第二个参数是二元表达式另一端的值。
@@ -434,6 +566,9 @@ class Field:
         overrides: 二元表达式评估时，若另一操作数为 `key` ，最终评估结果为 `value`。
         cache: 默认不启用缓存，传递 CacheConfig 启用缓存。
         skip_default_on_meta: 由 `on_meta` 函数注册时，不添加该字段的默认表达式。
+        memo: 同一事件的提取结果在所有回调间共享，`extractor` 须没有副作用。为可调用对象时其返回值会作为附加的键，用于区分依赖上下文（如模块前缀）的提取结果。
+        share_result: 与常量构成的二元表达式在同一事件的回调间只评估一次。`memo` 为 `True` 的字段默认共享，用于有副作用但每个事件只应执行一次的字段（如限速）。
+        discriminator: 判别字段。表达式顶层与常量的 `Equal` 会被 `ExprPool` 索引，事件只评估判别值相符的回调。`extractor` 须为只依赖事件本身、不会抛出异常的同步函数，仅对 `PM` 中的字段生效。并列表达式会据此自适应调整其评估顺序。
         _requires_extractor: 声明该字段需要由模块通过 `register_extractor` 注册 `extractor`。若为 `True` 且 `extractor` 未被注册，`build_cond` 将不会自动添加默认表达式。该参数没有必要在 `core.expr` 的外部使用。
         _redirect: 重定向到其他字段。该参数无法在元类为 `PatternMatcherMeta` 的类的外部使用。
     """
@@ -447,6 +582,9 @@ class Field:
     overrides: dict = None
     cache: CacheConfig = None
     skip_default_on_meta: bool = True
+    memo: bool | Callable[[], Hashable] = False
+    share_result: bool = False
+    discriminator: bool = False
     _requires_extractor: bool = False
     _redirect: str = None
 
@@ -501,14 +639,20 @@ class BinaryExprMeta(type):
 
         if cls.convert_rhs:
             BinaryExprMeta.convert_rhs[cls] = cls.convert_rhs
+        if "_evaluate_logic" in attrs:
+            cls._async_logic = attrs.get("_async_logic", False) or iscoroutinefunction(attrs["_evaluate_logic"])
 
 
 class BinaryExpr[Left, Right, Result](Expr[Result], metaclass=BinaryExprMeta):
     """二元表达式基类"""
 
-    __slots__ = ("negate", "left", "right", "priority", "_cache_config", "_cached_evaluate")
+    __slots__ = ("negate", "left", "right", "priority", "_cache_config", "_cached_evaluate", "_shared")
 
     convert_rhs: Callable[[Any], Any] = None
+    _async_logic = False
+    """`_evaluate_logic` 是否返回需要等待的对象"""
+    _shareable = True
+    """`_evaluate_logic` 是否没有副作用，可以在同一事件的回调间共享评估结果"""
 
     def __init__(self, left: Left | Expr, right: Right | Expr, _negate=None):
         self.left = left
@@ -524,14 +668,29 @@ class BinaryExpr[Left, Right, Result](Expr[Result], metaclass=BinaryExprMeta):
         else:
             self.priority = 0
             self._cache_config = None
+        self._shared = False
         super().__init__()
 
+    def _replace(self, **changes):
+        new = super()._replace(**changes)
+        new._shared = False
+        if new._cache_config:
+            new._cached_evaluate = async_cached(
+                new._cache_config.cache, ignore=new._cache_config.ignore_cache, func=new._evaluate_wrapper
+            )
+        return new
+
     def __repr__(self):
         if self._exp:
             return f"{self.__class__.__name__}({self.left!r}, {self.right!r}, exp={strftime("%Y-%m-%d %H:%M:%S", localtime(self._exp))}, PRI={self.priority})"
         return f"{self.__class__.__name__}({self.left!r}, {self.right!r}, PRI={self.priority})"
 
     async def evaluate(self, event) -> Result:
+        if self._shared:
+            return await _memoized_async(id(self), self._evaluate, event)
+        return await self._evaluate(event)
+
+    async def _evaluate(self, event) -> Result:
         if DEBUG:
             if (debug := _current_debug.get()) is None:
                 _current_debug.set(debug := defaultdict(dict))
@@ -576,17 +735,85 @@ class BinaryExpr[Left, Right, Result](Expr[Result], metaclass=BinaryExprMeta):
             (debug := _current_debug.get()[self])["left"] = left_val
             debug["right"] = right_val
 
-        return await self._evaluate_logic(left_val, right_val), (
+        result = self._evaluate_logic(left_val, right_val)
+        if self._async_logic:
+            result = await result
+        return result, (
             {(obj := getattr(dispatcher, v)): obj.get() for v in self._cache_config.contextvars} if self._cache_config else {}
         )
 
     @abstractmethod
-    async def _evaluate_logic(self, left_val: Left, right_val: Right) -> Result:
+    def _evaluate_logic(self, left_val: Left, right_val: Right) -> Result:
         raise NotImplementedError
 
+    def _compile(self):
+        run, is_async = self._compile_node()
+        if self._shared:
+            return partial(_memoized_async if is_async else _memoized_sync, id(self), run), is_async
+        return run, is_async
+
+    def _compile_node(self):
+        # 覆盖
+        if (
+            self.left.__class__ is FieldClause
+            and (overrides := self.left.field.overrides)
+            and isinstance(self.right, Hashable)
+            and (result := overrides.get(self.right))
+        ):
+            result = result if self.negate is None else result ^ self.negate
+            return lambda _: result, False
+        # 缓存需要经过 async_cached
+        if self._cache_config:
+            return self.evaluate, True
+
+        left, left_async = compile_expr(left) if isinstance(left := self.left, Expr) else (left, None)
+        right, right_async = compile_expr(right) if isinstance(right := self.right, Expr) else (right, None)
+        logic, logic_async, negate = self._evaluate_logic, self._async_logic, self.negate
+
+        if left_async or right_async or logic_async:
+
+            async def run(event):
+                if left_async is None:
+                    left_val = left
+                else:
+                    left_val = await left(event) if left_async else left(event)
+                if right_async is None:
+                    right_val = right
+                else:
+                    right_val = await right(event) if right_async else right(event)
+                if left_val.__class__ is AlwaysTrue or right_val.__class__ is AlwaysTrue:
+                    result = True
+                else:
+                    result = await logic(left_val, right_val) if logic_async else logic(left_val, right_val)
+                return result if negate is None else result ^ negate
+
+            return run, True
+
+        if left_async is not None and right_async is None:  # 常见情况：字段与常量
+
+            def run(event):
+                if (left_val := left(event)).__class__ is AlwaysTrue:
+                    result = True
+                else:
+                    result = logic(left_val, right)
+                return result if negate is None else result ^ negate
+
+            return run, False
+
+        def run(event):
+            left_val = left if left_async is None else left(event)
+            right_val = right if right_async is None else right(event)
+            if left_val.__class__ is AlwaysTrue or right_val.__class__ is AlwaysTrue:
+                result = True
+            else:
+                result = logic(left_val, right_val)
+            return result if negate is None else result ^ negate
+
+        return run, False
+
 
 class BoolExpr(Expr[bool]):
-    """布尔逻辑表达式基类"""
+    """布尔逻辑表达式基类。子句先按 `priority` 排序，编译后再由 `_ClauseOrder` 依运行时统计调整相邻字段比较子句的求值顺序"""
 
     __slots__ = ("clauses", "priority")
 
@@ -611,6 +838,137 @@ class BoolExpr(Expr[bool]):
         return f"{self.__class__.__name__}({", ".join(repr(c) for c in self.clauses)})"
 
 
+_SAMPLE_MASK = 15  # 每 16 次评估抽样一次
+_REORDER_SAMPLES = 256
+
+
+def _is_pure(expr) -> bool:
+    """可与相邻子句交换位置：不会因前面的子句未通过而抛出异常，且没有副作用、不设置上下文变量
+
+    只接受判别字段本身及其与常量的相等、成员比较。其他字段的 `extractor` 可能依赖前面子句的保护（如 `gid` 在私聊中会抛出异常），
+    含 `GetAttr`、`Call`、`Apply` 等运算的子句同理，均视为屏障。
+    """
+    if expr.__class__ is FieldClause:
+        return expr.field.discriminator and not expr.field.share_result
+    if isinstance(expr, BinaryExpr):
+        return (
+            expr._shareable
+            and (isinstance(expr, Equal) or isinstance(expr, In) and expr.right.__class__ in (tuple, list))
+            and not isinstance(expr.right, (Expr, LocalizedString))
+            and expr.left.__class__ is FieldClause
+            and _is_pure(expr.left)
+        )
+    if isinstance(expr, BoolExpr):
+        return all(map(_is_pure, expr.clauses))
+    if isinstance(expr, Not):
+        return _is_pure(expr.clause)
+    return isinstance(expr, RawCondition)
+
+
+def _clause_rank(entry):
+    # 平均耗时 / 决定结果的概率，越小越先评估
+    evals, hits, cost = entry[2]
+    return cost * (evals + 2) / (evals * (hits + 1)) if evals else inf
+
+
+class _ClauseOrder:
+    """`BoolExpr` 编译结果的自适应子句顺序
+
+    抽样记录各子句的耗时与决定结果（`And` 中为假，`Or` 中为真）的次数，定期按 平均耗时 / 决定概率 重排。
+    只有相邻的判别字段与常量比较之间会交换位置，其他字段、限速、`GetAttr`、`Apply` 等子句及其前后关系保持不变。
+    顺序只保存在本对象中，节点的 `clauses` 不会被修改。
+    """
+
+    __slots__ = ("entries", "runs", "decisive", "calls", "samples")
+
+    def __init__(self, owner: BoolExpr, compiled: Iterable[tuple[Callable, bool]], runs: list[tuple[int, int]], decisive: bool):
+        self.entries = tuple((func, is_async, [0, 0, 0], c) for c, (func, is_async) in zip(owner.clauses, compiled))
+        self.runs = runs  # 可重排的子句区间
+        self.decisive = decisive
+        self.calls = self.samples = 0
+
+    @classmethod
+    def create(cls, owner: BoolExpr, compiled: Sequence[tuple[Callable, bool]], decisive: bool):
+        if DEBUG:
+            return None
+        runs, i = [], 0
+        for pure, group in groupby(map(_is_pure, owner.clauses)):
+            n = len(tuple(group))
+            if pure and n > 1:
+                runs.append((i, i + n))
+            i += n
+        return cls(owner, compiled, runs, decisive) if runs else None
+
+    def compile(self):
+        decisive = self.decisive
+        if any(is_async for _, is_async, *_ in self.entries):
+
+            async def run(event):
+                self.calls += 1
+                if not self.calls & _SAMPLE_MASK:
+                    return await self.sample_async(event)
+                for clause, is_async, *_ in self.entries:
+                    if bool(await clause(event) if is_async else clause(event)) is decisive:
+                        return decisive
+                return not decisive
+
+            return run, True
+
+        def run(event):
+            self.calls += 1
+            if not self.calls & _SAMPLE_MASK:
+                return self.sample(event)
+            for clause, *_ in self.entries:
+                if bool(clause(event)) is decisive:
+                    return decisive
+            return not decisive
+
+        return run, False
+
+    async def sample_async(self, event):
+        result = not (decisive := self.decisive)
+        for clause, is_async, stat, _ in self.entries:
+            start = perf_counter_ns()
+            value = await clause(event) if is_async else clause(event)
+            stat[2] += perf_counter_ns() - start
+            stat[0] += 1
+            if bool(value) is decisive:
+                stat[1] += 1
+                result = decisive
+                break
+        self._sampled()
+        return result
+
+    def sample(self, event):
+        result = not (decisive := self.decisive)
+        for clause, _, stat, _ in self.entries:
+            start = perf_counter_ns()
+            value = clause(event)
+            stat[2] += perf_counter_ns() - start
+            stat[0] += 1
+            if bool(value) is decisive:
+                stat[1] += 1
+                result = decisive
+                break
+        self._sampled()
+        return result
+
+    def _sampled(self):
+        if (samples := self.samples + 1) < _REORDER_SAMPLES:
+            self.samples = samples
+        else:
+            self.reorder()
+
+    def reorder(self):
+        self.samples = 0
+        entries = list(self.entries)
+        for start, end in self.runs:
+            entries[start:end] = sorted(entries[start:end], key=_clause_rank)
+        for entry in entries:
+            (stat := entry[2])[:] = (stat[0] >> 1, stat[1] >> 1, stat[2] >> 1)  # 衰减，使顺序跟随流量变化
+        self.entries = tuple(entries)
+
+
 # endregion
 # region 运算表达式
 def _command_evaluate(left, right):
@@ -629,18 +987,17 @@ def _command_evaluate(left, right):
 
 
 class Equal(BinaryExpr[Any, Any | LocalizedString, bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         if self.left is PM.command:
             return _command_evaluate(left_val, right_val) if len(left_val) == len(right_val) else False
 
         elif self.left is PM.message and isinstance(right_val, LocalizedString):
             from .dispatcher import current_lang
 
-            for lang, i10n in right_val.translations.items():
-                if i10n == left_val:
-                    current_lang.set(lang)
-                    return True
-            return False
+            if (lang := right_val.lang_of(left_val)) is None:
+                return False
+            current_lang.set(lang)
+            return True
 
         return left_val == right_val
 
@@ -651,7 +1008,7 @@ class NotEqual(Equal):
 
 
 class In(BinaryExpr[Any, Container | Iterable | KeysView | ValuesView, bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         return left_val in right_val
 
 
@@ -661,7 +1018,7 @@ class NotIn(In):
 
 
 class Contains(BinaryExpr[Container | Iterable | KeysView | ValuesView, Any, bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         return right_val in left_val
 
 
@@ -671,7 +1028,7 @@ class NotContains(Contains):
 
 
 class StartsWith(BinaryExpr[Sequence | str, Sequence | str, bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         if self.left is PM.command:
             if len(left_val) >= (rl := len(right_val)) and _command_evaluate(left_val, right_val):
                 from .dispatcher import current_args
@@ -690,7 +1047,7 @@ class NotStartsWith(StartsWith):
 
 
 class EndsWith(BinaryExpr[Sequence | str, Sequence | str, bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         if isinstance(left_val, str):
             return left_val.endswith(right_val)
         return is_suffix(left_val, right_val)
@@ -703,7 +1060,7 @@ class NotEndsWith(EndsWith):
 
 """
 class SubClassOf(BinaryExpr[type, type | tuple[type, ...], bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         return issubclass(left_val, right_val)
 
 
@@ -713,7 +1070,7 @@ class NotSubClassOf(SubClassOf):
 
 
 class SuperClassOf(BinaryExpr[type, type, bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         return issubclass(right_val, left_val)
 
 
@@ -723,7 +1080,7 @@ class NotSuperClassOf(SuperClassOf):
 
 
 class InstanceOf(BinaryExpr[Any, type | tuple[type, ...], bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         return isinstance(left_val, right_val)
 
 
@@ -733,7 +1090,7 @@ class NotInstanceOf(InstanceOf):
 
 
 class HasInstance(BinaryExpr[type | tuple[type, ...], Any, bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         return isinstance(right_val, left_val)
 
 
@@ -744,7 +1101,7 @@ class NotHasInstance(HasInstance):
 
 
 class IsOnly(BinaryExpr[Sequence, TypeAdapter, bool]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         if len(left_val) != 1:
             return False
         if self.left is PM.command and right_val.__class__ is TypeAdapter:
@@ -760,7 +1117,7 @@ class IsOnly(BinaryExpr[Sequence, TypeAdapter, bool]):
 
 
 class IsNotOnly(IsOnly):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         if len(left_val) != 1:
             return True
         if self.left is PM.command and right_val.__class__ is TypeAdapter:
@@ -784,8 +1141,9 @@ def _convert_pattern_rhs(value):
 
 class Match(BinaryExpr[str, re.Pattern | LocalizedString, re.Match | None]):
     convert_rhs = _convert_pattern_rhs
+    _shareable = False
 
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         from .dispatcher import current_lang, current_match
 
         if isinstance(right_val, LocalizedString):
@@ -802,8 +1160,9 @@ class Match(BinaryExpr[str, re.Pattern | LocalizedString, re.Match | None]):
 
 class FullMatch(BinaryExpr[str, re.Pattern | LocalizedString, re.Match | None]):
     convert_rhs = _convert_pattern_rhs
+    _shareable = False
 
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         from .dispatcher import current_lang, current_match
 
         if isinstance(right_val, LocalizedString):
@@ -820,8 +1179,9 @@ class FullMatch(BinaryExpr[str, re.Pattern | LocalizedString, re.Match | None]):
 
 class Search(BinaryExpr[str, re.Pattern | LocalizedString, re.Match | None]):
     convert_rhs = _convert_pattern_rhs
+    _shareable = False
 
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         from .dispatcher import current_lang, current_match
 
         if isinstance(right_val, LocalizedString):
@@ -836,10 +1196,27 @@ class Search(BinaryExpr[str, re.Pattern | LocalizedString, re.Match | None]):
         return match
 
 
+def _chain_seg_types(adapter) -> tuple[type[MsgSeg], ...] | None:
+    """`TypeAdapter(MessageChain[X])` 中 X 对应的消息段类型，无法确定时返回 None"""
+    if get_origin(type_ := getattr(adapter, "_type", None)) not in (MessageChain, list) or len(args := get_args(type_)) != 1:
+        return None
+    types = get_args(args[0]) if get_origin(args[0]) in (Union, UnionType) else args
+    return types if all(isinstance(t, type) and issubclass(t, MsgSeg) for t in types) else None
+
+
 class ValidateBy[Value](BinaryExpr[Value, TypeAdapter, Value | Any]):
+    __slots__ = ("_seg_types",)
+
     convert_rhs = lambda x: x if isinstance(x, TypeAdapter) else TypeAdapter(x)
 
-    async def _evaluate_logic(self, left_val, right_val):
+    def __init__(self, left, right, _negate=None):
+        super().__init__(left, right, _negate)
+        # 校验消息链时先以类型位掩码排除不可能通过的
+        self._seg_types = _chain_seg_types(right) if isinstance(right, TypeAdapter) else None
+
+    def _evaluate_logic(self, left_val, right_val):
+        if self._seg_types and isinstance(left_val, MessageChain) and not left_val.only_seg(self._seg_types):
+            return None
         try:
             return right_val.validate_python(left_val)
         except ValidationError:
@@ -847,11 +1224,12 @@ class ValidateBy[Value](BinaryExpr[Value, TypeAdapter, Value | Any]):
 
 
 class PureApply[Value, Result](BinaryExpr[Value, Callable[[Value], Result], Result]):
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         return right_val(left_val)
 
 
 class Apply(PureApply):
+    _shareable = False
     __pure_funcs = {abs, aiter, ascii, bin, callable, chr, dir, format, hash, hex, id, iter, len, oct, ord, repr, round, vars}
     __pure_cls = (int, float, complex, str, type, range, slice, memoryview, super, reversed)
 
@@ -865,25 +1243,27 @@ class GetAttr[Obj](BinaryExpr[Obj, str, Any]):
     def __call__(self, *args, **kwargs):
         return Call(self, args, kwargs)
 
-    async def _evaluate_logic(self, left_val, right_val):
+    def _evaluate_logic(self, left_val, right_val):
         return getattr(left_val, right_val)
 
 
 class PureCall(BinaryExpr[Callable, tuple[tuple, dict], Any]):
     def __init__(self, func: Callable | Expr, args, kwargs):
-        super().__init__(func, None)
-        self.right = (args, kwargs)
+        super().__init__(func, (args, kwargs))
 
     def __repr__(self):
         if self._exp:
             return f"{self.left!r} {self.__class__.__name__} {self.args} {self.kwargs}(exp={strftime("%Y-%m-%d %H:%M:%S", localtime(self._exp))}, PRI={self.priority})"
         return f"{self.left!r} {self.__class__.__name__} {self.args} {self.kwargs}(PRI={self.priority})"
 
+    _async_logic = True
+
     def _evaluate_logic(self, left_val, right_val):
         return async_run_func(left_val, *right_val[0], **right_val[1])
 
 
 class Call(PureCall):
+    _shareable = False
     __pure_methods = {
         "__lt__",
         "__le__",
@@ -920,11 +1300,59 @@ class And(BoolExpr):
     async def evaluate(self, event):
         return await async_all(await clause.evaluate(event) for clause in self.clauses)
 
+    def _compile(self):
+        compiled = tuple(compile_expr(c) for c in self.clauses)
+        if order := _ClauseOrder.create(self, compiled, False):
+            return order.compile()
+        if any(is_async for _, is_async in compiled):
+
+            async def run(event):
+                for clause, is_async in compiled:
+                    if not (await clause(event) if is_async else clause(event)):
+                        return False
+                return True
+
+            return run, True
+
+        clauses = tuple(clause for clause, _ in compiled)
+
+        def run(event):
+            for clause in clauses:
+                if not clause(event):
+                    return False
+            return True
+
+        return run, False
+
 
 class Or(BoolExpr):
     async def evaluate(self, event):
         return await async_any(await clause.evaluate(event) for clause in self.clauses)
 
+    def _compile(self):
+        compiled = tuple(compile_expr(c) for c in self.clauses)
+        if order := _ClauseOrder.create(self, compiled, True):
+            return order.compile()
+        if any(is_async for _, is_async in compiled):
+
+            async def run(event):
+                for clause, is_async in compiled:
+                    if await clause(event) if is_async else clause(event):
+                        return True
+                return False
+
+            return run, True
+
+        clauses = tuple(clause for clause, _ in compiled)
+
+        def run(event):
+            for clause in clauses:
+                if clause(event):
+                    return True
+            return False
+
+        return run, False
+
 
 class Not(Expr):
     __slots__ = ("clause", "priority")
@@ -932,6 +1360,7 @@ class Not(Expr):
     def __init__(self, clause):
         self.clause = clause if isinstance(clause, Expr) else RawCondition(clause)
         self.priority = clause.priority
+        super().__init__()
 
     def __repr__(self):
         if self._exp:
@@ -941,6 +1370,16 @@ class Not(Expr):
     async def evaluate(self, event):
         return not await self.clause.evaluate(event)
 
+    def _compile(self):
+        clause, is_async = compile_expr(self.clause)
+        if is_async:
+
+            async def run(event):
+                return not await clause(event)
+
+            return run, True
+        return lambda event: not clause(event), False
+
 
 def and_(*clauses):
     return And(*clauses)
@@ -1056,6 +1495,7 @@ def _convert_to_validate(operator, right):
 # endregion
 # region 限速
 cfg.register("limit", 3, _("expr.fields.limit.cfg_comment"), module="aha")
+cfg.register("limit_snapshot_interval", 60, _("expr.fields.limit.snapshot_cfg_comment"), module="aha")
 
 
 class MsgLimit(dbBase):
@@ -1066,104 +1506,190 @@ class MsgLimit(dbBase):
     last_time = Column(Float)
 
 
+class RateLimiter:
+    """内存中的限速计数，距上一条消息超过 `window` 秒后重新计数
+
+    计数存放于紧凑数组，由 `snapshot` 定期及退出时写入 `message_limit` 表，启动时由 `restore` 读回。
+    """
+
+    __slots__ = ("window", "_slots", "_counts", "_times", "_free", "_dirty", "_lock")
+
+    def __init__(self, window: float = 60):
+        self.window = window
+        self._slots: dict[tuple[str, str], int] = {}
+        self._counts = array("I")
+        self._times = array("d")
+        self._free: list[int] = []
+        self._dirty: set[tuple[str, str]] = set()
+        self._lock = Lock()
+
+    def hit(self, platform: str, user_id: str, now: float = None) -> int:
+        """记录一条消息，返回窗口内的消息数"""
+        if now is None:
+            now = time()
+        with self._lock:
+            if (slot := self._slots.get(key := (platform, user_id))) is None:
+                slot = self._slots[key] = self._alloc()
+                count = 1
+            elif self._times[slot] <= now - self.window:
+                count = 1
+            else:
+                count = self._counts[slot] + 1
+            self._counts[slot] = count
+            self._times[slot] = now
+            self._dirty.add(key)
+        return count
+
+    def _alloc(self):
+        if self._free:
+            return self._free.pop()
+        self._counts.append(0)
+        self._times.append(0.0)
+        return len(self._counts) - 1
+
+    async def restore(self):
+        """读回窗口内的计数，不会覆盖启动后已产生的计数"""
+        expire = time() - self.window
+        async with db_sessionmaker() as session:
+            rows = (await session.execute(select(MsgLimit).where(MsgLimit.last_time > expire))).scalars().all()
+        with self._lock:
+            for row in rows:
+                if (key := (row.platform, row.user_id)) not in self._slots:
+                    slot = self._slots[key] = self._alloc()
+                    self._counts[slot] = row.count
+                    self._times[slot] = row.last_time
+
+    async def snapshot(self):
+        """将变更的计数写入数据库，并释放已过窗口的计数"""
+        expire = time() - self.window
+        with self._lock:
+            rows = [
+                {"platform": key[0], "user_id": key[1], "count": self._counts[slot], "last_time": self._times[slot]}
+                for key in self._dirty
+                if self._times[slot := self._slots[key]] > expire
+            ]
+            dirty, self._dirty = self._dirty, set()
+            for key, slot in tuple(self._slots.items()):
+                if self._times[slot] <= expire:
+                    del self._slots[key]
+                    self._free.append(slot)
+
+        async def write(session: AsyncSession):
+            await session.execute(delete(MsgLimit).where(MsgLimit.last_time <= expire))
+            if rows:
+                await session.execute(
+                    (stmt := insert(MsgLimit).values(rows)).on_conflict_do_update(
+                        index_elements=(MsgLimit.platform, MsgLimit.user_id),
+                        set_={MsgLimit.count: stmt.excluded.count, MsgLimit.last_time: stmt.excluded.last_time},
+                    )
+                )
+
+        try:
+            await db_writer.submit(write)
+        except Exception:
+            with self._lock:
+                self._dirty.update(key for key in dirty if key in self._slots)
+            _logger.exception(_("expr.fields.limit.snapshot_error"))
+
+
+rate_limiter = RateLimiter()
+
+
+async def start_rate_limiter():
+    """读回限速计数并开始定期快照，须在调度器启动后调用"""
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    from services.apscheduler import sched
+
+    await rate_limiter.restore()
+    if interval := cfg.get("limit_snapshot_interval", module="aha"):
+        await sched.add_schedule(rate_limiter.snapshot, IntervalTrigger(seconds=interval))
+
+
 async def _check_rate_limit(event: BaseEvent):
     """被限速 => False，正常状态 => True"""
     if not cfg.limit or not hasattr(event, "user_id") or await _is_admin(event):
         return True
-    current_time = time()
-    async with db_sessionmaker() as session:
-        result = await session.execute(
-            update(MsgLimit)
-            .where(
-                MsgLimit.platform == event.platform, MsgLimit.user_id == event.user_id, MsgLimit.last_time <= current_time - 60
-            )
-            .values(count=1, last_time=current_time)
-            .returning(MsgLimit.count)
-        )
-        if result.scalar_one_or_none() is not None:
-            await session.commit()
-            return True
-
-        updated_count = await session.scalar(
-            insert(MsgLimit)
-            .values(platform=event.platform, user_id=event.user_id, count=1, last_time=current_time)
-            .on_conflict_do_update(
-                index_elements=(MsgLimit.platform, MsgLimit.user_id),
-                set_={MsgLimit.count: MsgLimit.count + 1, MsgLimit.last_time: current_time},
-            )
-            .returning(MsgLimit.count)
-        )
-        await session.commit()
-        return updated_count <= cfg.get("limit", module="aha")
+    return rate_limiter.hit(event.platform, event.user_id) <= cfg.get("limit", module="aha")
 
 
 # endregion
 # region 消息处理
-cprms: ContextVar[str] = ContextVar("aha_prefix_removed_str_msg", default=None)
-cprmc: ContextVar[MessageChain] = ContextVar("aha_prefix_removed_msg_chain", default=None)
+def get_msg_str_without_prefix(msg: MessageChain):
+    return str(remove_msg_seq_prefix(msg))
 
 
-def get_msg_str_without_prefix(msg: MessageChain):
-    from .dispatcher import current_event
+def _current_prefix():
+    """当前回调适用的消息前缀"""
+    from .dispatcher import cugp, current_module
 
-    if (cache := msg is current_event.get().message) and (moded := cprms.get()):
-        return moded
-    moded = str(remove_msg_seq_prefix(msg))
-    if cache:
-        cprms.set(moded)
-    return moded
+    return cfg.global_msg_prefix if cugp.get() else cfg.get_msg_prefix(current_module.get())
 
 
 def remove_msg_seq_prefix(msg: MessageChain):
-    from .dispatcher import cugp, current_event, current_module
+    from .dispatcher import current_event
 
-    if (prefix := cfg.global_msg_prefix if cugp.get() else cfg.get_msg_prefix(current_module.get())) is None:
+    if (prefix := _current_prefix()) is None:
         return msg
-    # 缓存
-    if (cache := (event := current_event.get()).message is msg) and (moded := cprmc.get()) is not None:
-        return moded
+    return _remove_prefix(msg, prefix, current_event.get().self_id)
+
+
+def _remove_prefix(msg: MessageChain, prefix: str, self_id: str) -> MessageChain:
+    """去除前缀后的消息链，结果缓存于 `msg.view_cache`，不得修改"""
+    if (moded := (cache := msg.view_cache).get(key := ("without_prefix", prefix, self_id))) is None:
+        moded = cache[key] = _strip_prefix(msg, prefix, self_id)
+    return moded
 
+
+def _strip_prefix(msg: MessageChain, prefix: str, self_id: str):
     moded = None
     i, text = find_first_instance(msg, Text)
     # 去除@bot前缀
-    if (at := find_first_instance(msg, At, end_index=i)[1]) and at.user_id == event.self_id:
+    if (at := find_first_instance(msg, At, end_index=i)[1]) and at.user_id == self_id:
         del (moded := msg.copy())[0]
         i -= 1
-        moded[i] = text = text.model_copy()
-        text.text = text.text.lstrip()
+        # 以 `update` 复制而非修改字段，不使其他消息链的缓存失效
+        moded[i] = text = text.model_copy(update={"text": text.text.lstrip()})
     # 去除文本前缀
     if prefix and text and text.text:
         # 去除前缀
         if len(prefix) == 1:
             if halfwidth(text.text[0]) == prefix:
-                if not moded:
-                    (moded := msg.copy())[i] = text = text.model_copy()
-                text.text = text.text[1:].lstrip()
-                if not text.text:
+                if moded is None:
+                    moded = msg.copy()
+                if stripped := text.text[1:].lstrip():
+                    moded[i] = text.model_copy(update={"text": stripped})
+                else:
                     del moded[i]
         elif text.text.startswith(prefix):
-            if not moded:
-                (moded := msg.copy())[i] = text = text.model_copy()
-            text.text = text.text[len(prefix) :].lstrip()
-            if not text.text:
+            if moded is None:
+                moded = msg.copy()
+            if stripped := text.text[len(prefix) :].lstrip():
+                moded[i] = text.model_copy(update={"text": stripped})
+            else:
                 del moded[i]
 
-    if moded is None:
-        moded = msg
-    if cache:
-        cprmc.set(moded)
-    return moded
+    return msg if moded is None else moded
+
+
+def msg_str_without_prefix(event: BaseEvent, prefix: str | None):
+    """以指定前缀获取 `PM.message` 的提取值，不依赖上下文"""
+    if not isinstance(event, Message):
+        return None
+    return str(event.message if prefix is None else _remove_prefix(event.message, prefix, event.self_id))
 
 
 # endregion
 def _has_msg_prefix(event: Message):
-    from .dispatcher import cugp, current_module
-
     if event.message:
-        if (prefix := cfg.global_msg_prefix if cugp.get() else cfg.get_msg_prefix(current_module.get())) is None:
+        if (prefix := _current_prefix()) is None:
             return True
         i, text = find_first_instance(event.message, Text)
-        if (at := find_first_instance(event.message, At, end_index=i)[1]) and at.user_id == event.self_id:
+        if (
+            event.message.has_seg(At)
+            and (at := find_first_instance(event.message, At, end_index=i)[1])
+            and at.user_id == event.self_id
+        ):
             return True
         if prefix and text and text.text:
             return halfwidth(text.text[0]) == prefix if len(prefix) == 1 else text.text.startswith(prefix)
@@ -1196,8 +1722,14 @@ async def _is_super(_):
 
 
 def _msg2command(event: Message):
+    if (command := (cache := (msg := remove_msg_seq_prefix(event.message)).view_cache).get("command")) is None:
+        command = cache["command"] = _tokenize_command(msg)
+    return command
+
+
+def _tokenize_command(msg: MessageChain):
     command = []
-    for m in remove_msg_seq_prefix(event.message):
+    for m in msg:
         if isinstance(m, Text):
             splited = m.text.partition("\n")
             command.extend(s.strip() for s in splited[0].split(" "))
@@ -1224,21 +1756,22 @@ def _wrap_conditions(conditions, event_type: EventCategory):
             return None if (converted := recursion(expr.clause)) is None else Not(converted)
 
         elif isinstance(expr, BinaryExpr):
-            expr.left, expr.right = _adjust_binary_field(expr.left, expr.right)
-            expr.left = recursion(expr.left)
+            # 不修改调用方的表达式，有变化时构造新节点
+            left, right = _adjust_binary_field(expr.left, expr.right)
+            left = recursion(left)
 
-            if expr.left.__class__ is FieldClause:
-                if expr.left.field.binary_semantics:
-                    operand = expr.left.field.binary_semantics(expr.__class__, expr.right)
+            if left.__class__ is FieldClause:
+                if left.field.binary_semantics:
+                    operand = left.field.binary_semantics(expr.__class__, right)
                 else:
                     operand = expr.__class__
                 if converter := BinaryExprMeta.convert_rhs.get(expr.__class__):
-                    expr.right = converter(expr.right)
-                if expr.left.field.rhs_converter:
-                    expr.right = expr.left.field.rhs_converter(expr.right, operand, event_type)
-                return operand(expr.left, expr.right)
+                    right = converter(right)
+                if left.field.rhs_converter:
+                    right = left.field.rhs_converter(right, operand, event_type)
+                return operand(left, right)
 
-            return expr
+            return expr if left is expr.left and right is expr.right else expr._replace(left=left, right=right)
 
         elif is_first_level or isinstance(expr, RawCondition) and (expr := expr.value) is not None:
             for t, f in _registed_operand_types.items():
@@ -1373,6 +1906,7 @@ class PM(metaclass=PatternMatcherMeta):
     message: FieldClause[str] = Field(
         lambda event: get_msg_str_without_prefix(event.message) if isinstance(event, Message) else None,
         operand_types={(LocalizedString, str, re.Pattern): FullMatch},
+        memo=_current_prefix,
         cache=CacheConfig(
             LRUCache(cfg.register("message_match", 2048, _("expr.fields.msg.cache"), module="cache")),
             lambda operator, right, event: hash((operator, right, event.message_str)),
@@ -1387,6 +1921,7 @@ class PM(metaclass=PatternMatcherMeta):
         lambda event: remove_msg_seq_prefix(event.message) if isinstance(event, Message) else None,
         binary_semantics=_convert_to_validate,
         operand_types={(type, GenericAlias, UnionType, TypeAdapter, _Final, _UnionGenericAlias): ValidateBy},
+        memo=_current_prefix,
     )
     msg_chain: FieldClause[MessageChain] = Field(_redirect="message_chain")
     command: FieldClause[list[str | MsgSeg]] = Field(
@@ -1394,11 +1929,16 @@ class PM(metaclass=PatternMatcherMeta):
         binary_semantics=_convert_to_isonly,
         rhs_converter=_convert_command_rhs,
         operand_types={(list, tuple): Equal},
+        memo=_current_prefix,
     )
     # endregion
     # region 类型匹配字段
     type_: FieldClause[EventType] = Field(
-        lambda event: event.event_type, rhs_converter=_convert_type_rhs, operand_types={EventType: Equal}, priority=39
+        lambda event: event.event_type,
+        rhs_converter=_convert_type_rhs,
+        operand_types={EventType: Equal},
+        priority=39,
+        discriminator=True,
     )
     request: FieldClause[RequestEventType] = Field(_redirect="type_")
     notice: FieldClause[NoticeEventType] = Field(_redirect="type_")
@@ -1408,39 +1948,46 @@ class PM(metaclass=PatternMatcherMeta):
         rhs_converter=_convert_sub_type_rhs,
         operand_types={EventSubType: Equal},
         priority=40,
+        discriminator=True,
     )
     # endregion
     # region 来源限定字段
-    isgroup: FieldClause[bool] = Field(lambda event: bool(getattr(event, "group_id", False)), priority=6)
+    isgroup: FieldClause[bool] = Field(lambda event: bool(getattr(event, "group_id", False)), priority=6, discriminator=True)
     isprivate: FieldClause[bool] = Field(
         lambda event: not getattr(event, "group_id", False),
         None if cfg.register("private", True, _("expr.fields.isprivate.default_cfg"), module="aha") else (lambda v: v == False),
         priority=7,
+        discriminator=True,
     )
-    gid: FieldClause[int] = Field(_gid, priority=3)
-    uid: FieldClause[int] = Field(_uid, priority=2)
+    gid: FieldClause[int] = Field(_gid, priority=3, memo=True)
+    uid: FieldClause[int] = Field(_uid, priority=2, memo=True)
     group: FieldClause[Group] = Field(
         lambda event: (Group(event.platform, group_id) if (group_id := getattr(event, "group_id", None)) else AlwaysTrue()),
         _groups_default_factory,
         priority=5,
+        memo=True,
     )
     user: FieldClause[User] = Field(
         lambda event: User(event.platform, getattr(event, "user_id", None)),
         _users_default_factory,
         priority=4,
+        memo=True,
     )
-    platform: FieldClause[str] = Field(lambda event: event.platform, priority=8)
+    platform: FieldClause[str] = Field(lambda event: event.platform, priority=8, discriminator=True)
     bot: FieldClause[int] = Field(lambda event: event.bot_id, priority=10)
     # endregion
     # region 功能控制字段
-    prefix: FieldClause[bool] = Field(_has_msg_prefix)  # 消息内容相关的都别设置优先级
-    admin: FieldClause[bool] = Field(_is_admin, priority=-50)
-    super: FieldClause[bool] = Field(_is_super, priority=50)
-    validated: FieldClause[bool] = Field(default=lambda v: v == True, _requires_extractor=True, priority=-10)
+    prefix: FieldClause[bool] = Field(_has_msg_prefix, memo=_current_prefix)  # 消息内容相关的都别设置优先级
+    admin: FieldClause[bool] = Field(_is_admin, priority=-50, memo=True)
+    super: FieldClause[bool] = Field(_is_super, priority=50, memo=True)
+    validated: FieldClause[bool] = Field(
+        default=lambda v: v == True, share_result=True, _requires_extractor=True, priority=-10
+    )
     limit: FieldClause[bool] = Field(
         _check_rate_limit,
         (lambda v: v == True) if cfg.get("limit", module="aha") else None,
         overrides={False: True},
+        share_result=True,
         priority=-999,
     )
     # endregion
@@ -1468,6 +2015,70 @@ Psuper: FieldClause[bool] = PM.super
 Pvalidated: FieldClause[bool] = PM.validated
 Plimit: FieldClause[bool] = PM.limit
 
+discriminator_fields: tuple[FieldClause, ...] = tuple({id(f): f.clause for f in fields.values() if f.discriminator}.values())
+
+
+def discriminator_values(event: BaseEvent):
+    """按 `discriminator_fields` 的顺序提取事件的判别值"""
+    return tuple(f.field.extractor(event) for f in discriminator_fields)
+
+
+def extract_discriminators(expr: Expr | Any) -> dict[FieldClause, Hashable]:
+    """提取表达式顶层并列的判别字段与常量的等值约束"""
+    result = {}
+    if isinstance(expr, Expr):
+        for clause in expr.clauses if expr.__class__ is And else (expr,):
+            if (
+                clause.__class__ is Equal
+                and clause.negate is None
+                and clause.left.__class__ is FieldClause
+                and clause.left.field.discriminator
+                and not isinstance(clause.right, Expr)
+                and isinstance(clause.right, Hashable)
+            ):
+                result.setdefault(clause.left, clause.right)
+    return result
+
+
+def extract_msg_literals(expr: Expr | Any) -> frozenset[str] | None:
+    """提取表达式顶层并列的 `PM.message` 与字面量的等值约束，返回所有可能匹配的消息文本。没有该约束时返回 `None`"""
+    if isinstance(expr, Expr):
+        for clause in expr.clauses if expr.__class__ is And else (expr,):
+            if clause.__class__ is Equal and clause.negate is None and clause.left is PM.message:
+                if clause.right.__class__ is str:
+                    return frozenset((clause.right,))
+                if clause.right.__class__ is LocalizedString and clause.right.translations is not None:
+                    return clause.right.variants
+    return None
+
+
+def extract_msg_initials(expr: Expr | Any) -> tuple[bool, frozenset[str]] | None:
+    """分析表达式顶层并列的 `PM.message` 正则约束可能匹配的消息首字符
+
+    Returns:
+        第一个元素为是否忽略大小写，第二个元素为 `utils.string.pattern_initials` 的返回值。没有可分析的约束时返回 `None`。
+    """
+    if not isinstance(expr, Expr):
+        return None
+    for clause in expr.clauses if expr.__class__ is And else (expr,):
+        if clause.__class__ in (Match, FullMatch, Search) and clause.negate is None and clause.left is PM.message:
+            if isinstance(clause.right, LocalizedString):
+                patterns = clause.right.patterns.values()
+            elif isinstance(clause.right, re.Pattern):
+                patterns = (clause.right,)
+            else:
+                continue
+            if len(ignorecase := {bool(p.flags & re.I) for p in patterns}) != 1:
+                continue
+            initials = set()
+            for pattern in patterns:
+                if (result := pattern_initials(pattern, clause.__class__ is not Search)) is None:
+                    break
+                initials |= result
+            else:
+                return ignorecase.pop(), frozenset(initials)
+    return None
+
 
 def field_exists(expr: Expr | Any, field: FieldClause | Iterable[FieldClause]) -> bool:
     """检查表达式中是否存在指定字段"""
@@ -1541,18 +2152,81 @@ def build_cond(
         and (default_value := field.default(field.clause)) is not None
     ]
 
-    if len(conditions := conditions + default_clauses) == 1:
-        cond: Expr = conditions[0]
+    exp = exp if exp is None or exp >= 1000000000 else (time() + exp)
+    if len(conditions := conditions + default_clauses) > 1:
+        cond = And(*map(intern_expr, conditions))._replace(_exp=exp)
+    elif isinstance(cond := conditions[0], (BinaryExpr, BoolExpr, Not)):
+        # 根节点带有 `_exp`，复制而不修改调用方的表达式
+        cond = _intern_children(cond)._replace(_exp=exp)
     else:
-        cond = And(*conditions)
-
-    cond._exp = exp if exp is None or exp >= 1000000000 else (time() + exp)
+        cond = And(cond)._replace(_exp=exp)
     if debug:
         cond._debug = debug
 
     return cond
 
 
+# region 公共子表达式
+_interned: WeakValueDictionary[tuple, Expr] = WeakValueDictionary()
+
+
+def _const_key(value):
+    # 值类型按值合并，其余对象按身份合并
+    return (value.__class__, value) if value.__class__ in (str, int, float, bool, bytes, frozenset) else id(value)
+
+
+def _operand_key(value):
+    return id(value) if isinstance(value, Expr) else _const_key(value)
+
+
+def _intern_children(expr: Expr):
+    """将子表达式替换为唯一实例，有变化时返回新节点，不修改 `expr`"""
+    if isinstance(expr, BinaryExpr):
+        left = intern_expr(expr.left) if isinstance(expr.left, Expr) else expr.left
+        right = intern_expr(expr.right) if isinstance(expr.right, Expr) else expr.right
+        if left is not expr.left or right is not expr.right:
+            return expr._replace(left=left, right=right)
+    elif isinstance(expr, BoolExpr):
+        clauses = [intern_expr(c) for c in expr.clauses]
+        if any(new is not old for new, old in zip(clauses, expr.clauses)):
+            return expr._replace(clauses=clauses)
+    elif isinstance(expr, Not):
+        if (clause := intern_expr(expr.clause)) is not expr.clause:
+            return expr._replace(clause=clause)
+    return expr
+
+
+def _shares_result(expr: BinaryExpr):
+    return (
+        expr._shareable
+        and expr.left.__class__ is FieldClause
+        and not isinstance(expr.right, Expr)
+        and not expr._cache_config
+        and ((field := expr.left.field).memo is True or field.share_result)
+    )
+
+
+def intern_expr[T: Expr | Any](expr: T) -> T:
+    """自底向上合并结构相同的子表达式，返回唯一的实例
+
+    子表达式按身份、常量按值（值类型）或身份比较。字段与常量构成的二元表达式在 `_shareable`、字段的 `memo` 为 `True` 或声明了 `share_result` 且没有启用缓存时，会在同一事件的回调间共享评估结果。
+    带有 `_exp` 的表达式（即回调的条件）不会被合并，`cfg.debug` 为 `True` 时不合并。
+    """
+    if DEBUG or not isinstance(expr, (BinaryExpr, BoolExpr, Not)) or expr._exp:
+        return expr
+    expr = _intern_children(expr)
+    if isinstance(expr, BinaryExpr):
+        key = (expr.__class__, _operand_key(expr.left), _operand_key(expr.right), expr.negate)
+    elif isinstance(expr, BoolExpr):
+        key = (expr.__class__, *map(id, expr.clauses))
+    else:
+        key = (Not, id(expr.clause))
+    if (interned := _interned.setdefault(key, expr)) is expr and isinstance(expr, BinaryExpr) and _shares_result(expr):
+        expr._shared = True
+    return interned
+
+
+# endregion
 # region 重定向 extractor
 extractor_registrations: defaultdict[FieldClause, dict[str, Callable]] = defaultdict(dict)
 
@@ -1584,13 +2258,30 @@ def redirect_extractors():
 
 
 # endregion
+def compile_expr(expr: Expr) -> tuple[Callable[[BaseEvent], Any], bool]:
+    """将表达式编译为扁平的闭包
+
+    extractor 与运算均为同步时生成同步闭包，只有包含异步 extractor、缓存或异步运算的节点才生成协程函数。
+    评估结果与 `Expr.evaluate` 一致，包括对 ContextVar 的修改。`cfg.debug` 为 `True` 时不编译。
+
+    Returns:
+        第一个元素为接收事件的闭包，第二个元素为其是否为协程函数。
+    """
+    if DEBUG:
+        return expr.evaluate, True
+    return expr._compile()
+
+
 async def evaluate(event, expr: Expr | BoolExpr, token=None, pool: ExprPool = None) -> bool | None:
     """评估表达式入口"""
     if expr._exp and pool and expr._exp <= time():
         pool.remove_key(expr)
         return None
     try:
-        result = await expr.evaluate(event)
+        if (compiled := expr._compiled) is None:
+            result = await expr.evaluate(event)
+        else:
+            result = await compiled[0](event) if compiled[1] else compiled[0](event)
         if DEBUG:
             if expr._debug:
                 pprint(dict(_current_debug.get()))
@@ -16,7 +16,7 @@ from tenacity import _unset
 import core.status
 from utils.aha import caller_aha_module
 
-__all__ = ("create_translator", "gettext", "_")
+__all__ = ("create_translator", "gettext", "_", "keys_of")
 
 # fmt: off
 LANGUAGE_FALLBACKS = {
@@ -75,6 +75,8 @@ LANGUAGE_FALLBACKS = {
 DEFAULT_LANGUAGE = None
 loaded_i10n: defaultdict[str, dict[str, dict[str, str]]] = defaultdict(dict)  # dict[module, dict[lang, dict[key, value]]]
 _created_translator = defaultdict(dict)  # dict[module, dict[lang, Callable]]
+_fallback_chains: dict[str | None, tuple[str, ...]] = {}
+_reverse_index: dict[str, frozenset[tuple[str | None, str]]] | None = None  # 翻译文本到 (模块, 键)，加载翻译后重建
 _logger = getLogger("AHA (i18n)")
 
 
@@ -87,8 +89,29 @@ class LocalizedString(str):
         obj._module = module
         obj.translations = get_all_translations(obj._key, obj._module)
         obj._patterns = None
+        obj._langs = None
         return obj
 
+    @property
+    def variants(self) -> frozenset[str]:
+        """所有已存在语言的翻译"""
+        return frozenset(self._get_langs())
+
+    def lang_of(self, text: str) -> str | None:
+        """`text` 等于哪种语言的翻译，不等于任何翻译时返回 None"""
+        return self._get_langs().get(text)
+
+    def _get_langs(self) -> dict[str, str]:
+        # 翻译到语言代码，同一翻译取首个语言
+        if (langs := self._langs) is None:
+            if (translations := self.translations) is None:  # 已编译为正则表达式
+                translations = {lang: pattern.pattern for lang, pattern in self._patterns.items()}
+            langs = {}
+            for lang, text in translations.items():
+                langs.setdefault(text, lang)
+            self._langs = langs
+        return langs
+
     @property
     def patterns(self) -> dict[str, Pattern]:
         """编译所有已存在语言的翻译为正则表达式"""
@@ -117,6 +140,20 @@ def get_all_translations(key: str, module: str | None):
     return {lang: d[key] for lang, d in loaded_i10n[module].items() if key in d}
 
 
+def keys_of(text: str) -> frozenset[tuple[str | None, str]]:
+    """翻译为 `text` 的所有 (模块, 键)"""
+    global _reverse_index
+    if (index := _reverse_index) is None:
+        reverse = defaultdict(set)
+        for module, langs in tuple(loaded_i10n.items()):
+            for translations in tuple(langs.values()):
+                for key, value in tuple(translations.items()):
+                    if isinstance(value, str):
+                        reverse[value].add((module, key))
+        index = _reverse_index = {value: frozenset(keys) for value, keys in reverse.items()}
+    return index.get(text, frozenset())
+
+
 L18NABLE_MODULE_PATTERN = compile(r"^((?:[^.]*modules|bots)\.[^.]+)")
 
 
@@ -134,6 +171,12 @@ def create_translator(module: str = None, lang_code: str = None) -> Callable[[st
 
 
 def _get_fallback_chain(lang_code: str | None):
+    if (chain := _fallback_chains.get(lang_code)) is None:
+        chain = _fallback_chains[lang_code] = tuple(_build_fallback_chain(lang_code))
+    return chain
+
+
+def _build_fallback_chain(lang_code: str | None):
     global DEFAULT_LANGUAGE
     chain = []
     seen = set()
@@ -178,6 +221,11 @@ def _get_fallback_chain(lang_code: str | None):
 _yaml = YAML(typ="safe")
 
 
+def _invalidate_reverse_index():
+    global _reverse_index
+    _reverse_index = None
+
+
 async def load_locales(*module: str):
     cwd = Path(sys.modules["__main__"].__file__).parent
 
@@ -185,6 +233,7 @@ async def load_locales(*module: str):
         tasks = []
         for mod in module:
             loaded_i10n[mod].clear()
+            _invalidate_reverse_index()
             module_path = cwd / mod.replace(".", os.sep)
             if (await module_path.is_dir()) and await (locales_path := module_path / "locales").exists():
                 tasks.append(create_task(_process_locales_directory(mod, locales_path), eager_start=True))
@@ -193,6 +242,7 @@ async def load_locales(*module: str):
             await gather(*tasks)
     else:
         loaded_i10n[None].clear()
+        _invalidate_reverse_index()
         await _process_locales_directory(None, cwd / "locales")
 
 
@@ -218,5 +268,6 @@ async def _process_locale_file(module: str | None, file_path: Path):
         if (lang_code := file_path.stem) not in loaded_i10n[module]:
             loaded_i10n[module][lang_code] = {}
         loaded_i10n[module][lang_code].update(_yaml.load(content))
+        _invalidate_reverse_index()
     except Exception as e:
         _logger.error(f"Can't processing {file_path}: {e}")
@@ -1,17 +1,26 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable
+from logging import getLogger
+from sys import intern
+from threading import Lock as ThreadLock
 from typing import TYPE_CHECKING, overload
 
 from aiologic import Lock
-from sqlalchemy import BigInteger, Column, String, select
+from sqlalchemy import BigInteger, Column, String, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from xxhash import xxh3_64_digest
 
-from core.database import db_sessionmaker, dbBase
+from core.database import db_sessionmaker, db_writer, dbBase
 from models.core import Group, User
 from utils.sqlalchemy import insert_ignore, upsert
 
 from .cache import LRUCache
 from .config import cfg
 from .i18n import _
+from .timer import timer_wheel
+
+_logger = getLogger("AHA (identity)")
 
 
 class AhaUser(dbBase):
@@ -32,12 +41,241 @@ class AhaGroup(dbBase):
 
 CACHER = LRUCache(cfg.register("aha_id", 32768, _("identity.cache.cfg_comment"), module="cache"))
 CACHER_LOCK = Lock()
+cfg.register("aha_id_preload", False, _("identity.preload.cfg_comment"), module="cache")
+
+_TABLES = {User: (AhaUser, "user_id"), Group: (AhaGroup, "group_id")}
 
 
 def _generate_aha_id(platform, entity_id):
     return int.from_bytes(xxh3_64_digest(platform + entity_id), signed=True)
 
 
+# region 预载
+class IdentityIndex:
+    """启动时载入的身份表，存放于紧凑数组中，按 Aha ID 反查与判断是否已落库均为二分查找。
+
+    载入后的新增与映射变更记于 `delta`，优先于数组中的记录。
+    """
+
+    __slots__ = (
+        "kind",
+        "platforms",
+        "row_platforms",
+        "entity_ids",
+        "aha_ids",
+        "order",
+        "keys",
+        "delta",
+        "_delta_rev",
+        "_lock",
+    )
+
+    def __init__(self, kind: type):
+        self.kind = kind
+        self.platforms: dict[str, int] = {}
+        self.row_platforms = array("H")  # 行 -> 平台序号
+        self.entity_ids: list[str] = []  # 行 -> 实体 ID
+        self.aha_ids = array("q")  # 载入时为行 -> Aha ID，封存后为升序 Aha ID
+        self.order = array("L")  # 与 `aha_ids` 对应的行号
+        self.keys = array("q")  # 升序的 (平台, ID) 哈希
+        self.delta: dict[tuple[str, str], int] = {}
+        self._delta_rev: dict[int, set[tuple[str, str]]] = {}
+        self._lock = ThreadLock()
+
+    def add_row(self, platform: str, entity_id: str, aha_id: int, key: int):
+        self.row_platforms.append(self.platforms.setdefault(platform, len(self.platforms)))
+        self.entity_ids.append(intern(entity_id))
+        self.aha_ids.append(aha_id)
+        self.keys.append(key)
+
+    def seal(self):
+        """载入完毕后排序"""
+        order = sorted(range(len(self.aha_ids)), key=self.aha_ids.__getitem__)
+        self.order = array("L", order)
+        self.aha_ids = array("q", (self.aha_ids[i] for i in order))
+        self.keys = array("q", sorted(self.keys))
+        self.platforms = tuple(self.platforms)
+
+    def __contains__(self, key: tuple[str, str]):
+        if key in self.delta:
+            return True
+        hashed = _generate_aha_id(*key)
+        return (i := bisect_left(self.keys, hashed)) < len(self.keys) and self.keys[i] == hashed
+
+    def record(self, platform: str, entity_id: str, aha_id: int):
+        key = (platform, entity_id)
+        with self._lock:
+            if (old := self.delta.get(key)) is not None:
+                self._delta_rev[old].discard(key)
+            self.delta[key] = aha_id
+            self._delta_rev.setdefault(aha_id, set()).add(key)
+
+    def lookup(self, aha_id: int):
+        lo = bisect_left(self.aha_ids, aha_id)
+        hi = bisect_right(self.aha_ids, aha_id, lo)
+        rows = [(self.platforms[self.row_platforms[r]], self.entity_ids[r]) for r in self.order[lo:hi]]
+        with self._lock:
+            result = [self.kind(*key) for key in rows if key not in self.delta]
+            result.extend(self.kind(*key) for key in self._delta_rev.get(aha_id, ()))
+        return result
+
+
+# endregion
+# region 后写
+class IdentityWriter:
+    """Aha ID 由 (平台, ID) 哈希确定，解析时直接返回，落库由本队列合并后批量写入。
+
+    启动时读入 aha_id 与哈希不一致（被映射过）的记录，此前解析仍走数据库。
+    开启预载时整表载入 `indexes`，反查不再访问数据库。
+    """
+
+    __slots__ = ("overrides", "indexes", "ready", "_pending", "_lock", "_timer")
+
+    DELAY = 2
+    BATCH = 1000
+
+    def __init__(self):
+        self.overrides: dict[tuple[type, str, str], int] = {}
+        self.indexes: dict[type, IdentityIndex] = {}
+        self.ready = False
+        self._pending: dict[tuple[type, str, str], int] = {}
+        self._lock = ThreadLock()
+        self._timer = None
+
+    async def load(self):
+        """读入被映射过的记录并启用后写，须在数据库初始化后调用"""
+        overrides, indexes = {}, {}
+        preload = cfg.get("aha_id_preload", module="cache")
+        async with db_sessionmaker() as session:
+            for kind, (table, column) in _TABLES.items():
+                index = indexes[kind] = IdentityIndex(kind) if preload else None
+                stmt = select(table.platform, getattr(table, column), table.aha_id).execution_options(yield_per=self.BATCH)
+                async for platform, entity_id, aha_id in await session.stream(stmt):
+                    if aha_id != (key := _generate_aha_id(platform, entity_id)):
+                        overrides[(kind, platform, entity_id)] = aha_id
+                    if index is not None:
+                        index.add_row(platform, entity_id, aha_id, key)
+        for key, aha_id in overrides.items():
+            # 加载期间 `map_user` 写入的更新
+            self.overrides.setdefault(key, aha_id)
+        if preload:
+            for kind, index in indexes.items():
+                index.seal()
+                # 加载期间 `map_user` 写入的更新
+                for (k, platform, entity_id), aha_id in self.overrides.items():
+                    if k is kind:
+                        index.record(platform, entity_id, aha_id)
+            self.indexes = indexes
+        self.ready = True
+
+    def resolve(self, kind: type, platform: str, entity_id: str):
+        """由映射表或哈希得到 Aha ID，后者加入写入队列"""
+        if (result := self.overrides.get(key := (kind, platform, entity_id))) is not None:
+            return result
+        result = _generate_aha_id(platform, entity_id)
+        if (index := self.indexes.get(kind)) is not None:
+            if (platform, entity_id) in index:
+                return result
+            index.record(platform, entity_id, result)
+        with self._lock:
+            self._pending[key] = result
+            if self._timer is None:
+                self._timer = timer_wheel.call_later(self.DELAY, self.flush)
+        return result
+
+    def pending_of(self, kind: type, aha_id: int):
+        """尚未落库的记录中 Aha ID 为 `aha_id` 的实体"""
+        with self._lock:
+            return [kind(p, e) for (k, p, e), i in self._pending.items() if k is kind and i == aha_id]
+
+    def discard(self, kind: type, platform: str, entity_id: str):
+        with self._lock:
+            self._pending.pop((kind, platform, entity_id), None)
+
+    async def flush(self):
+        """将队列中的记录写入数据库，已存在的保持不变"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+
+        rows: dict[type, list[dict]] = {}
+        for (kind, platform, entity_id), aha_id in pending.items():
+            rows.setdefault(kind, []).append({"platform": platform, _TABLES[kind][1]: entity_id, "aha_id": aha_id})
+
+        async def write(session: AsyncSession):
+            for kind, values in rows.items():
+                table = _TABLES[kind][0]
+                for i in range(0, len(values), self.BATCH):
+                    await session.execute(
+                        insert(table)
+                        .values(values[i : i + self.BATCH])
+                        .on_conflict_do_nothing(index_elements=[col.name for col in table.__table__.primary_key])
+                    )
+
+        try:
+            await db_writer.submit(write)
+        except Exception:
+            with self._lock:
+                for key, aha_id in pending.items():
+                    self._pending.setdefault(key, aha_id)
+                if self._timer is None:
+                    self._timer = timer_wheel.call_later(self.DELAY, self.flush)
+            _logger.exception(_("identity.flush_error") % len(pending))
+
+
+identity_writer = IdentityWriter()
+
+
+async def start_identity_service():
+    """读入映射记录并启用后写，须在数据库初始化后调用"""
+    await identity_writer.load()
+
+
+async def _resolve_many(kind: type, platform: str, entity_ids: Iterable[str]) -> dict[str, int]:
+    if identity_writer.ready:
+        return {entity_id: identity_writer.resolve(kind, platform, entity_id) for entity_id in dict.fromkeys(entity_ids)}
+
+    result, missing = {}, []
+    async with CACHER_LOCK:
+        for entity_id in dict.fromkeys(entity_ids):
+            if (aha_id := CACHER.get((kind, platform, entity_id))) is None:
+                missing.append(entity_id)
+            else:
+                result[entity_id] = aha_id
+    if not missing:
+        return result
+
+    # 后写启用前整批插入并取回已存在的映射
+    table, column = _TABLES[kind]
+    async with db_sessionmaker() as session:
+        for i in range(0, len(missing), IdentityWriter.BATCH):
+            result.update(
+                await session.execute(
+                    insert(table)
+                    .values(
+                        [
+                            {"platform": platform, column: entity_id, "aha_id": _generate_aha_id(platform, entity_id)}
+                            for entity_id in missing[i : i + IdentityWriter.BATCH]
+                        ]
+                    )
+                    .on_conflict_do_update(
+                        index_elements=[col.name for col in table.__table__.primary_key], set_={"platform": table.platform}
+                    )
+                    .returning(getattr(table, column), table.aha_id)
+                )
+            )
+        await session.commit()
+    async with CACHER_LOCK:
+        for entity_id in missing:
+            CACHER[(kind, platform, entity_id)] = result[entity_id]
+    return result
+
+
+# endregion
 # region 用户
 if TYPE_CHECKING:
 
@@ -70,6 +308,9 @@ async def user2aha_id(arg1=None, arg2=None, session=None):
     if not platform or not user_id:
         raise ValueError(f"Platform: {platform}, user id: {user_id}")
 
+    if identity_writer.ready:  # 未被映射时即为哈希，无需经过缓存与锁
+        return identity_writer.resolve(User, platform, user_id)
+
     async with CACHER_LOCK:
         if (result := CACHER.get((User, platform, user_id))) is not None:
             return result
@@ -97,8 +338,16 @@ async def user2aha_id(arg1=None, arg2=None, session=None):
             await session.close()
 
 
+async def users2aha_ids(platform: str, user_ids: Iterable[str]) -> dict[str, int]:
+    """批量获取同一平台用户的 Aha ID，如果不存在则自动注册"""
+    return await _resolve_many(User, platform, user_ids)
+
+
 async def aha_id2user(aha_id: int) -> list[User]:
     """根据 Aha ID 反向查找用户"""
+    if (index := identity_writer.indexes.get(User)) is not None:
+        return index.lookup(aha_id)
+
     async with CACHER_LOCK:
         if (result := CACHER.get((User, aha_id))) is not None:
             return result
@@ -108,20 +357,35 @@ async def aha_id2user(aha_id: int) -> list[User]:
             User(p, u)
             for p, u in (await session.execute(select(AhaUser.platform, AhaUser.user_id).where(AhaUser.aha_id == aha_id))).all()
         ]
+    result.extend(u for u in identity_writer.pending_of(User, aha_id) if u not in result)
 
+    if result:  # 解析不再回填反查缓存，空结果可能随后被新解析的实体填上
         async with CACHER_LOCK:
             CACHER[(User, aha_id)] = result
-        return result
+    return result
 
 
 async def map_user(source_platform: str, source_user_id: str, target_platform: str, target_user_id: str):
     """将一个平台的用户映射到另一个用户，建议不得映射自己"""
-    async with db_sessionmaker() as session:
-        target_aha_id = await user2aha_id(target_platform, target_user_id, session=session)
+    target_aha_id = await user2aha_id(target_platform, target_user_id)
+
+    async def write(session: AsyncSession):
+        # 目标用户可能仍在写入队列中
+        await session.execute(insert_ignore(AhaUser, platform=target_platform, user_id=target_user_id, aha_id=target_aha_id))
         # 更新源用户的aha_id
         await session.execute(upsert(AhaUser, platform=source_platform, user_id=source_user_id, aha_id=target_aha_id))
-        await session.commit()
 
+    await db_writer.submit(write)
+
+    identity_writer.discard(User, source_platform, source_user_id)
+    if (index := identity_writer.indexes.get(User)) is not None:
+        if (target_platform, target_user_id) not in index:
+            index.record(target_platform, target_user_id, target_aha_id)
+        index.record(source_platform, source_user_id, target_aha_id)
+    if target_aha_id == _generate_aha_id(source_platform, source_user_id):
+        identity_writer.overrides.pop((User, source_platform, source_user_id), None)
+    else:
+        identity_writer.overrides[(User, source_platform, source_user_id)] = target_aha_id
     async with CACHER_LOCK:
         CACHER[(User, source_platform, source_user_id)] = target_aha_id
         if (cache := CACHER.get((User, target_aha_id), None)) is None:
@@ -160,6 +424,9 @@ async def group2aha_id(arg1=None, arg2=None):
     if not platform or not group_id:
         raise ValueError(f"Platform: {platform}, group id: {group_id}")
 
+    if identity_writer.ready:  # 未被映射时即为哈希，无需经过缓存与锁
+        return identity_writer.resolve(Group, platform, group_id)
+
     async with CACHER_LOCK:
         if (result := CACHER.get((Group, platform, group_id))) is not None:
             return result
@@ -177,8 +444,16 @@ async def group2aha_id(arg1=None, arg2=None):
     return result
 
 
+async def groups2aha_ids(platform: str, group_ids: Iterable[str]) -> dict[str, int]:
+    """批量获取同一平台群组的 Aha ID，如果不存在则自动注册"""
+    return await _resolve_many(Group, platform, group_ids)
+
+
 async def aha_id2group(aha_id: int) -> list[Group]:
     """根据 Aha ID 反向查找群组"""
+    if (index := identity_writer.indexes.get(Group)) is not None:
+        return index.lookup(aha_id)
+
     async with CACHER_LOCK:
         if (result := CACHER.get((Group, aha_id))) is not None:
             return result
@@ -190,10 +465,12 @@ async def aha_id2group(aha_id: int) -> list[Group]:
                 await session.execute(select(AhaGroup.platform, AhaGroup.group_id).where(AhaGroup.aha_id == aha_id))
             ).all()
         ]
+    result.extend(g for g in identity_writer.pending_of(Group, aha_id) if g not in result)
 
+    if result:  # 解析不再回填反查缓存，空结果可能随后被新解析的实体填上
         async with CACHER_LOCK:
             CACHER[(Group, aha_id)] = result
-        return result
+    return result
 
 
 # endregion
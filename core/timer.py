@@ -0,0 +1,118 @@
+from asyncio import Task, create_task, sleep
+from collections.abc import Callable
+from inspect import isawaitable
+from logging import getLogger
+from math import ceil
+from threading import Lock
+from time import time
+
+from .i18n import _
+
+__all__ = ("TimerHandle", "TimerWheel", "timer_wheel")
+
+_logger = getLogger("AHA (timer)")
+
+
+class TimerHandle:
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    def __init__(self, deadline: float, callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """惰性取消，到期时跳过，不从时间轮中查找移除"""
+        self.cancelled = True
+        self.callback = self.args = None
+
+
+class TimerWheel:
+    """分层时间轮。每层 `2 ** bits` 个槽，第 n 层每槽跨度为 `tick * 2 ** (bits * n)`，超出最高层的定时器暂存于溢出表。
+
+    插入与取消均为 O(1)，到期时由高层逐级下放至第 0 层后触发。回调在事件循环中调用，返回可等待对象时创建任务。
+    线程安全。
+    """
+
+    __slots__ = ("tick", "_bits", "_mask", "_wheels", "_overflow", "_current", "_lock", "_task")
+
+    def __init__(self, tick=1.0, bits=6, levels=4):
+        self.tick = tick
+        self._bits = bits
+        self._mask = (1 << bits) - 1
+        self._wheels: list[list[list[TimerHandle]]] = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+        self._overflow: list[TimerHandle] = []
+        self._current = int(time() / tick)  # 最后一次推进到的刻度
+        self._lock = Lock()
+        self._task: Task = None
+
+    def call_at(self, deadline: float, callback: Callable, *args):
+        """在时间戳 `deadline` 调用 `callback(*args)`"""
+        handle = TimerHandle(deadline, callback, args)
+        with self._lock:
+            self._insert(handle)
+        return handle
+
+    def call_later(self, delay: float, callback: Callable, *args):
+        return self.call_at(time() + delay, callback, *args)
+
+    def _insert(self, handle: TimerHandle, earliest=1):
+        # 已过期的放在 `earliest` 刻度后触发；下放时当前刻度尚未收取，可直接放入
+        if (delta := (expire := ceil(handle.deadline / self.tick)) - self._current) < earliest:
+            expire, delta = self._current + earliest, earliest
+        for level, wheel in enumerate(self._wheels):
+            if delta >> (self._bits * (level + 1)) == 0:
+                wheel[(expire >> (self._bits * level)) & self._mask].append(handle)
+                return
+        self._overflow.append(handle)
+
+    def _cascade(self, level: int):
+        # 将高层当前槽内的定时器重新分配到低层
+        if level == len(self._wheels):
+            handles, self._overflow = self._overflow, []
+        else:
+            slot = (self._current >> (self._bits * level)) & self._mask
+            handles, self._wheels[level][slot] = self._wheels[level][slot], []
+            if slot == 0:
+                self._cascade(level + 1)
+        for handle in handles:
+            if not handle.cancelled:
+                self._insert(handle, 0)
+
+    def advance(self, now: float = None):
+        """推进到 `now` 并触发所有到期的定时器"""
+        target = int((time() if now is None else now) / self.tick)
+        due = []
+        with self._lock:
+            while self._current < target:
+                self._current += 1
+                if (slot := self._current & self._mask) == 0:
+                    self._cascade(1)
+                due.extend(self._wheels[0][slot])
+                self._wheels[0][slot] = []
+        for handle in due:
+            if handle.cancelled:
+                continue
+            try:
+                if isawaitable(result := handle.callback(*handle.args)):
+                    create_task(result)
+            except Exception:
+                _logger.exception(_("timer.callback_error") % handle.callback)
+
+    async def _run(self):
+        while True:
+            await sleep(self.tick - time() % self.tick)
+            self.advance()
+
+    def start(self):
+        if self._task is None:
+            self._task = create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+timer_wheel = TimerWheel()
@@ -1,7 +1,11 @@
 from collections.abc import Sequence
+from copy import deepcopy
 from datetime import datetime
+from enum import Enum
 from random import getrandbits
-from typing import Annotated, Any
+from types import NoneType
+from typing import Annotated, Any, Self
+from weakref import WeakSet
 
 from anyio import Path
 from pydantic import BeforeValidator, Field, PrivateAttr, field_validator
@@ -9,18 +13,24 @@ from xxhash import xxh3_64
 
 from utils.misc import is_one_instance_of_other
 
-from ..base import BaseModel, PureNameEnum
+from ..base import BaseModel, FrozenBaseModel, PureNameEnum
 from ..core import Group, User
 from ..msg import MessageChain, MsgSeg
 from .utils import Role  # , Sex
 
 
+_IMMUTABLE_TYPES = (str, int, float, complex, bytes, NoneType, datetime, Enum, frozenset, User, Group, FrozenBaseModel)
+
+
 class BaseEvent(BaseModel):
     bot_id: int = Field(default=None, exclude=True, repr=False)
     platform: str = Field(default=None, exclude=True, repr=False)
     adapter: str = Field(default=None, exclude=True, repr=False)
     _user_obj: User = PrivateAttr(None)
     _group_obj: Group = PrivateAttr(None)
+    _fingerprint: int = PrivateAttr(None)
+    _cow_source: BaseEvent = PrivateAttr(None)
+    _cow_views: WeakSet[BaseEvent] = PrivateAttr(None)
 
     time: datetime = Field(default_factory=datetime.now().astimezone)
     self_id: Annotated[str, BeforeValidator(str)] | None = None
@@ -58,12 +68,89 @@ class BaseEvent(BaseModel):
             self._group_obj = Group(self.platform, group_id)
             return self._group_obj
 
+    @property
+    def fingerprint(self) -> int:
+        """非零的 64 位事件指纹，用于去重与 API 路由。首次访问时由 `__hash__` 计算，副本共享原事件的指纹"""
+        if self._fingerprint is None:
+            self._fingerprint = self.__hash__() & 0xFFFFFFFFFFFFFFFF or 1
+        return self._fingerprint
+
     def __hash__(self):
         raise NotImplementedError
 
     def __eq__(self, other):
         return is_one_instance_of_other(self, other) and self.__hash__() == other.__hash__()
 
+    # region 写时复制
+    def cow_copy(self) -> Self:
+        """返回与 `model_copy(deep=True)` 隔离语义相同的副本
+
+        不可变的字段与原事件共享，可变字段在副本上首次访问时才深拷贝，赋值只影响副本。
+        原事件存在副本期间视为只读：为其字段赋值前会先让所有副本复制完毕，但不应原地修改其可变字段。
+        """
+        view = self.__class__.__new__(self.__class__)
+        object.__setattr__(view, "__dict__", {k: v for k, v in self.__dict__.items() if isinstance(v, _IMMUTABLE_TYPES)})
+        object.__setattr__(view, "__pydantic_fields_set__", set(self.__pydantic_fields_set__))
+        object.__setattr__(view, "__pydantic_extra__", deepcopy(self.__pydantic_extra__))
+        object.__setattr__(
+            view, "__pydantic_private__", {**self.__pydantic_private__, "_cow_source": self, "_cow_views": None}
+        )
+        if (views := (private := self.__pydantic_private__).get("_cow_views")) is None:
+            private["_cow_views"] = views = WeakSet()
+        views.add(view)
+        return view
+
+    def __setattr__(self, name, value):
+        if name in self.__class__.model_fields and (views := self.__pydantic_private__.get("_cow_views")):
+            # 副本尚未复制的字段仍指向本事件，修改前先令其复制
+            for view in tuple(views):
+                view._materialize()
+            views.clear()
+        super().__setattr__(name, value)
+
+    def __getattr__(self, item):
+        if (
+            item in self.__class__.model_fields
+            and (private := object.__getattribute__(self, "__pydantic_private__"))
+            and (source := private.get("_cow_source")) is not None
+        ):
+            self.__dict__[item] = value = deepcopy(getattr(source, item))
+            return value
+        return super().__getattr__(item)
+
+    def _materialize(self):
+        """复制所有尚未复制的字段并断开与原事件的关联"""
+        if self._cow_source is not None:
+            for name in self.__class__.model_fields.keys() - self.__dict__.keys():
+                getattr(self, name)
+            self._cow_source = None
+
+    def model_dump(self, **kwargs):
+        self._materialize()
+        return super().model_dump(**kwargs)
+
+    def model_dump_json(self, **kwargs):
+        self._materialize()
+        return super().model_dump_json(**kwargs)
+
+    def __copy__(self):
+        self._materialize()
+        return super().__copy__()
+
+    def __deepcopy__(self, memo=None):
+        self._materialize()
+        return super().__deepcopy__(memo)
+
+    def __iter__(self):
+        self._materialize()
+        return super().__iter__()
+
+    def __getstate__(self):
+        self._materialize()
+        return super().__getstate__()
+
+    # endregion
+
     def _recursion_hash(self, obj, hasher: xxh3_64):
         if isinstance(obj, dict):
             for k, v in obj.items():
@@ -3,9 +3,11 @@ import logging
 import os
 import re
 from asyncio import create_task, to_thread
-from collections.abc import AsyncGenerator, AsyncIterable, Iterable
+from collections.abc import AsyncGenerator, AsyncIterable, Hashable, Iterable
 from contextlib import asynccontextmanager
+from itertools import count
 from logging import getLogger
+from threading import Lock
 from types import NoneType
 from typing import TYPE_CHECKING, Annotated, Any, BinaryIO, ClassVar, Literal, SupportsIndex, dataclass_transform, overload
 from urllib.parse import urlparse
@@ -67,9 +69,18 @@ class MsgSegMeta(ModelMetaclass):
         return rf"\[Aha:{cls.__name__.lower()}{"".join(rf"(?:,{n}=(?P<{prefix}{n}>[^,\]]*))?" for n, i in cls.model_fields.items() if not i.exclude)}\]"
 
 
+_seg_versions = count(1)
+_seg_version = 0  # 任一消息段的字段被修改时更新，使所有消息链的派生结果缓存失效
+
+
 class MsgSeg(BaseModel, metaclass=MsgSegMeta):
     """消息段基类"""
 
+    def __setattr__(self, name, value):
+        global _seg_version
+        _seg_version = next(_seg_versions)
+        super().__setattr__(name, value)
+
     async def serialize(self):
         """转换为字典格式，排除空值和None字段"""
         data = {}
@@ -100,14 +111,40 @@ class MsgSeg(BaseModel, metaclass=MsgSegMeta):
         return self.__str__()
 
 
+_seg_bits: dict[type[MsgSeg], int] = {}
+_seg_bits_lock = Lock()
+_type_masks: dict[type[MsgSeg] | tuple[type[MsgSeg], ...], int] = {}
+
+
+def _seg_bit(cls: type[MsgSeg]):
+    if (bit := _seg_bits.get(cls)) is None:
+        with _seg_bits_lock:
+            if (bit := _seg_bits.get(cls)) is None:
+                bit = _seg_bits[cls] = 1 << len(_seg_bits)
+                _type_masks.clear()
+    return bit
+
+
+def seg_type_mask(types: type[MsgSeg] | tuple[type[MsgSeg], ...]) -> int:
+    """消息段类型（含子类）在 `MessageChain.seg_mask` 中对应的位"""
+    if (mask := _type_masks.get(types)) is None:
+        mask = _type_masks[types] = sum(bit for cls, bit in tuple(_seg_bits.items()) if issubclass(cls, types))
+    return mask
+
+
 class MessageChain[T: MsgSeg](list[T]):
     """消息数组，包含多个消息段。
 
+    维护消息段类型的位掩码与计数，`has_seg`、`only_seg` 无需遍历消息段。追加时增量更新，其余修改使其失效并在下次读取时重建。
+    渲染结果等派生数据缓存于 `view_cache`，消息链或任一消息段被修改后失效。
+
     Note:
         `Node` 不得与其他类型的实例在一个消息链中混用。
     """
 
     _event_type_cache: ClassVar[dict[str, type[MsgSeg]]] = {}
+    _seg_index: list[int | dict[type[MsgSeg], int]] | None = None  # [位掩码, 各类型计数]
+    _view_cache: tuple[int, dict[Hashable, Any]] | None = None  # (消息段版本, 缓存)
 
     @classmethod
     def __get_pydantic_core_schema__(cls, source_type, handler: GetCoreSchemaHandler):
@@ -142,15 +179,68 @@ class MessageChain[T: MsgSeg](list[T]):
             super().__init__(arg if isinstance(arg, MsgSeg) else Text(text=str(arg)) for arg in args)
 
     def __str__(self):
-        return "".join(str(item) for item in self)
+        if self.has_seg((Forward, Node)):  # 嵌套的消息链可能被原地修改
+            return "".join(str(item) for item in self)
+        if (text := (cache := self.view_cache).get("str")) is None:
+            text = cache["str"] = "".join(str(item) for item in self)
+        return text
 
     def __repr__(self):
         return self.__str__()
 
+    def __getstate__(self):
+        (state := self.__dict__.copy()).pop("_seg_index", None)
+        state.pop("_view_cache", None)
+        return state
+
+    @property
+    def view_cache(self) -> dict[Hashable, Any]:
+        """派生结果（渲染字符串、去除前缀后的消息链、命令分词等）的缓存"""
+        if (cache := self._view_cache) is None or cache[0] != _seg_version:
+            cache = self._view_cache = (_seg_version, {})
+        return cache[1]
+
     @classmethod
     def from_pydantic(cls, value):
         return value if isinstance(value, cls) else cls(value)
 
+    # region 消息段类型索引
+    def _get_seg_index(self):
+        if (index := self._seg_index) is None:
+            mask, counts = 0, {}
+            for seg in self:
+                counts[cls] = counts.get(cls := seg.__class__, 0) + 1
+            for cls in counts:
+                mask |= _seg_bit(cls)
+            index = self._seg_index = [mask, counts]
+        return index
+
+    def _seg_added(self, seg: MsgSeg):
+        if (index := self._seg_index) is not None:
+            index[1][cls] = index[1].get(cls := seg.__class__, 0) + 1
+            index[0] |= _seg_bit(cls)
+
+    @property
+    def seg_mask(self) -> int:
+        """消息段类型的位掩码，各类型的位由 `seg_type_mask` 获取"""
+        return self._get_seg_index()[0]
+
+    def seg_count(self, types: type[MsgSeg] | tuple[type[MsgSeg], ...]):
+        """指定类型（含子类）的消息段数量"""
+        if not self._get_seg_index()[0] & seg_type_mask(types):
+            return 0
+        return sum(n for cls, n in self._seg_index[1].items() if issubclass(cls, types))
+
+    def has_seg(self, types: type[MsgSeg] | tuple[type[MsgSeg], ...]):
+        """是否包含指定类型（含子类）的消息段"""
+        return bool(self._get_seg_index()[0] & seg_type_mask(types))
+
+    def only_seg(self, types: type[MsgSeg] | tuple[type[MsgSeg], ...]):
+        """消息链非空且只由指定类型（含子类）的消息段组成"""
+        return bool(mask := self._get_seg_index()[0]) and not mask & ~seg_type_mask(types)
+
+    # endregion
+
     if TYPE_CHECKING:
 
         @overload
@@ -159,19 +249,52 @@ class MessageChain[T: MsgSeg](list[T]):
         def __setitem__(self, key: slice, value: Iterable[T]) -> None: ...
 
     def __setitem__(self, key, value):
+        self._seg_index = self._view_cache = None
         if isinstance(key, slice):
             super().__setitem__(key, [v if isinstance(v, MsgSeg) else Text(text=str(v)) for v in value])
         else:
             super().__setitem__(key, value if isinstance(value, MsgSeg) else Text(text=str(value)))
 
+    def __delitem__(self, key: SupportsIndex | slice):
+        self._seg_index = self._view_cache = None
+        super().__delitem__(key)
+
     def extend(self, iterable: Iterable[T]):
-        super().extend(i if isinstance(i, MsgSeg) else Text(text=str(i)) for i in iterable)
+        super().extend(items := [i if isinstance(i, MsgSeg) else Text(text=str(i)) for i in iterable])
+        self._view_cache = None
+        if self._seg_index is not None:
+            for item in items:
+                self._seg_added(item)
 
     def append(self, item: T):
-        super().append(item if isinstance(item, MsgSeg) else Text(text=str(item)))
+        super().append(item := item if isinstance(item, MsgSeg) else Text(text=str(item)))
+        self._view_cache = None
+        self._seg_added(item)
 
     def insert(self, index: SupportsIndex, item: T):
-        super().insert(index, item if isinstance(item, MsgSeg) else Text(text=str(item)))
+        super().insert(index, item := item if isinstance(item, MsgSeg) else Text(text=str(item)))
+        self._view_cache = None
+        self._seg_added(item)
+
+    def pop(self, index: SupportsIndex = -1) -> T:
+        self._seg_index = self._view_cache = None
+        return super().pop(index)
+
+    def remove(self, value: T):
+        self._seg_index = self._view_cache = None
+        super().remove(value)
+
+    def clear(self):
+        self._seg_index = self._view_cache = None
+        super().clear()
+
+    def sort(self, *, key=None, reverse=False):
+        self._view_cache = None
+        super().sort(key=key, reverse=reverse)
+
+    def reverse(self):
+        self._view_cache = None
+        super().reverse()
 
     def __add__(self, other: MessageChain):
         return MessageChain(super().__add__(other), bot_id=self.bot_id)
@@ -186,6 +309,10 @@ class MessageChain[T: MsgSeg](list[T]):
     def __mul__(self, value: SupportsIndex):
         return MessageChain(super().__mul__(value), bot_id=self.bot_id)
 
+    def __imul__(self, value: SupportsIndex):
+        self._seg_index = self._view_cache = None
+        return super().__imul__(value)
+
     def copy(self):
         return MessageChain(super().copy(), bot_id=self.bot_id)
 
@@ -206,9 +333,11 @@ class MessageChain[T: MsgSeg](list[T]):
 
     def is_user_at(self, user_id: str | int, include_all=False):
         """检查是否@了指定用户"""
+        if not self.has_seg(At):
+            return False
         user_id = str(user_id)
         return any(
-            (isinstance(item, At) and item.user_id == user_id) or (include_all and item.user_id == "all") for item in self
+            isinstance(item, At) and (item.user_id == user_id or include_all and item.user_id == "all") for item in self
         )
 
     @classmethod
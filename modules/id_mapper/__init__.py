@@ -1,4 +1,3 @@
-from functools import partial
 from re import Match
 from time import time
 
@@ -8,9 +7,8 @@ from core.expr import Pmessage, Pprefix, Psuper
 from core.i18n import _
 from core.identity import map_user
 from core.perms import is_super
-from core.dispatcher import on_message
+from core.dispatcher import on_message, wait_for_message
 from models.api import Message
-from models.core import User
 from utils.aha import at_or_str
 
 linking: dict = {}
@@ -39,14 +37,17 @@ async def linker(event: Message, match_: Match, localizer):
     if (t := linking.get(event.user)) and t + 300 >= time():
         return await event.reply(localizer("frequently"))
 
-    linking[event.user] = time()
-    on_message(
-        Pmessage == "!y",
-        Pprefix == False,
-        exp=300,
-        callback=partial(check_link, args=(event.platform, event.user_id, platform, uid)),
-    )
-    return await event.reply(_("need"))
+    linking[user := event.user] = time()
+    await event.reply(_("need"))
+    try:
+        if not (confirm := await wait_for_message(platform, uid, check=_is_confirm)):
+            return
+    finally:
+        linking.pop(user, None)
+    if await map_user(event.platform, event.user_id, platform, uid):
+        return await confirm.reply(localizer("linked"))
+    else:
+        return await confirm.reply(localizer("unknown_user"))
 
 
 @on_message(_("command_admin") % (a := at_or_str(), a), Pprefix == True, Psuper == True)
@@ -59,9 +60,5 @@ async def linker_admin(event: Message, match_: Match, localizer):
         return await event.reply(localizer("unknown_user"))
 
 
-async def check_link(event: Message, localizer, args):
-    del linking[User(args[0], args[1])]
-    if await map_user(*args):
-        return await event.reply(localizer("linked"))
-    else:
-        return await event.reply(localizer("unknown_user"))
+def _is_confirm(event: Message):
+    return not Pprefix.field.extractor(event) and Pmessage.field.extractor(event) == "!y"
@@ -1,4 +1,4 @@
-from asyncio import Task, create_task, shield
+from asyncio import Task, create_task, gather, shield
 from collections.abc import Iterable
 from functools import partial
 from logging import getLogger
@@ -43,14 +43,13 @@ async def clean_data_store():
 
 async def _shield_commit():
     instances_to_commit = [instance for instance in tuple(_instances) if instance._has_changes]
-    async with core.database.db_sessionmaker() as session:
-        for instance in instances_to_commit:
-            try:
-                await instance.flush_to_db(session)
-                await session.commit()
-            except Exception:
-                _logger.exception(_("simple_data_store.commit_error") % instance._module)
-                await session.rollback()
+    # 同时提交以落入写入任务的同一批次
+    results = await gather(
+        *(core.database.db_writer.submit(instance.flush_to_db) for instance in instances_to_commit), return_exceptions=True
+    )
+    for instance, result in zip(instances_to_commit, results):
+        if isinstance(result, Exception):
+            _logger.error(_("simple_data_store.commit_error") % instance._module, exc_info=result)
 
 
 async def commit_worker():
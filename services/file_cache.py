@@ -15,7 +15,7 @@ from sqlalchemy import Column, Integer, select, update
 from xxhash import xxh3_128, xxh3_128_hexdigest
 
 from core.config import cfg
-from core.database import db_sessionmaker, dbBase
+from core.database import db_sessionmaker, db_writer, dbBase
 from core.i18n import _
 from models.sqlalchemy import Path as sqlPath
 from services.apscheduler import sched
@@ -72,11 +72,13 @@ class CacheFileSession:
 
     async def get_and_refresh(self, ttl: timedelta | int):
         if self.filename and await self.path.exists():
-            await self.db_session.execute(
+            # 续期无需与本会话的其他写入同属一个事务，交给写入任务合并提交；本会话仍持有事务，不能等待其提交
+            stmt = (
                 update(CacheFile)
                 .where(CacheFile.file_path == self.path)
                 .values(expires_at=time() + (ttl.total_seconds() if isinstance(ttl, timedelta) else ttl))
             )
+            db_writer.submit_nowait(lambda session: session.execute(stmt))
             return self.path
 
     @staticmethod
@@ -5,7 +5,7 @@ from typing import TYPE_CHECKING, overload
 from sqlalchemy import BigInteger, Column, Numeric, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.database import db_sessionmaker, dbBase
+from core.database import db_sessionmaker, db_writer, dbBase
 from core.identity import user2aha_id
 from core.dispatcher import current_event
 
@@ -53,25 +53,15 @@ async def adjust_point(arg1, arg2=None, arg3=None, /, session=None):
         user = await user2aha_id(arg1, arg2)
         delta = arg3
 
-    if session is None:
-        session = db_sessionmaker()
-        should_close_session = True
-    else:
-        should_close_session = False
-
-    try:
-        result = await session.scalar(
+    async def write(session: AsyncSession):
+        return await session.scalar(
             insert(Point)
             .values(user_id=user, points=delta)
             .on_conflict_do_update(index_elements=(Point.user_id,), set_={Point.points: Point.points + delta})
             .returning(Point.points)
         )
-        if should_close_session:
-            await session.commit()
-        return result
-    finally:
-        if should_close_session:
-            await session.close()
+
+    return await (db_writer.submit(write) if session is None else write(session))
 
 
 if TYPE_CHECKING:
@@ -275,7 +275,3 @@ class DefaultIndexedDict[_KT, _VT](IndexedDictMixin[_KT, _VT], defaultdict[_KT,
             /,
             **kwargs: _VT,
         ) -> None: ...
-
-    def __missing__(self, key: _KT, /) -> _VT:
-        self._keys.append(key)
-        return super().__missing__(key)
@@ -1,5 +1,6 @@
 import re
 import unicodedata
+from re import _constants, _parser
 from bisect import bisect_right
 from collections.abc import Callable, Coroutine, Iterable, Iterator
 from contextlib import suppress
@@ -51,6 +52,106 @@ def charclass_escape(s):
     return s
 
 
+# region 正则首字符分析
+_ASCII_FOLDABLE = re.compile(r"(?![\x00-\x7f])[a-z]", re.I)  # K(U+212A)、ſ 等在 re.I 下等同于 ASCII 字母的字符
+_MAX_INITIAL_RANGE = 256
+
+
+def casefold_initial(char: str) -> str | None:
+    """`re.I` 下首字符对应 `pattern_initials` 返回值中的键，返回 `None` 表示无法确定"""
+    if char.isascii():
+        return char.lower()
+    return None if _ASCII_FOLDABLE.match(char) else char
+
+
+def _caseless_initial(char: str):
+    if char.isascii():
+        return char.lower()
+    return char if char.lower() == char == char.upper() else None
+
+
+def _seq_initials(seq) -> tuple[set[str], bool] | None:
+    chars = set()
+    for op, av in seq:
+        if (result := _item_initials(op, av)) is None:
+            return None
+        chars |= result[0]
+        if not result[1]:
+            return chars, False
+    return chars, True
+
+
+def _item_initials(op, av) -> tuple[set[str], bool] | None:
+    match op:
+        case _constants.LITERAL:
+            return {chr(av)}, False
+        case _constants.IN:
+            chars = set()
+            for item_op, item_av in av:
+                if item_op is _constants.LITERAL:
+                    chars.add(chr(item_av))
+                elif item_op is _constants.RANGE and item_av[1] - item_av[0] < _MAX_INITIAL_RANGE:
+                    chars.update(map(chr, range(item_av[0], item_av[1] + 1)))
+                else:
+                    return None
+            return chars, False
+        case _constants.BRANCH:
+            chars, nullable = set(), False
+            for branch in av[1]:
+                if (result := _seq_initials(branch)) is None:
+                    return None
+                chars |= result[0]
+                nullable = nullable or result[1]
+            return chars, nullable
+        case _constants.SUBPATTERN:
+            return None if (av[1] | av[2]) & re.I else _seq_initials(av[3])
+        case _constants.ATOMIC_GROUP:
+            return _seq_initials(av)
+        case _constants.MAX_REPEAT | _constants.MIN_REPEAT | _constants.POSSESSIVE_REPEAT:
+            if (result := _seq_initials(av[2])) is None:
+                return None
+            return result[0], result[1] or not av[0]
+        case _constants.AT | _constants.ASSERT | _constants.ASSERT_NOT:  # 零宽
+            return set(), True
+    return None
+
+
+def pattern_initials(pattern: re.Pattern, anchored=True) -> frozenset[str] | None:
+    """分析正则表达式从字符串开头匹配时可能的首字符
+
+    Args:
+        anchored: 是否从字符串开头匹配（`match`/`fullmatch`）。为 `False` 时只有以 `^` 或 `\\A` 开头的表达式可以分析。
+
+    Returns:
+        启用 `re.I` 时经过了 `casefold_initial` 处理。返回 `None` 表示无法确定或可以匹配空字符串。
+    """
+    if not isinstance(pattern.pattern, str):
+        return None
+    try:
+        seq = _parser.parse(pattern.pattern, pattern.flags).data
+    except re.error:
+        return None
+
+    if not anchored:
+        if not seq or seq[0][0] is not _constants.AT:
+            return None
+        if not (
+            seq[0][1] is _constants.AT_BEGINNING_STRING
+            or seq[0][1] is _constants.AT_BEGINNING
+            and not pattern.flags & re.MULTILINE
+        ):
+            return None
+
+    if (result := _seq_initials(seq)) is None or result[1]:
+        return None
+    if pattern.flags & re.I:
+        if None in (chars := {_caseless_initial(c) for c in result[0]}):
+            return None
+        return frozenset(chars)
+    return frozenset(result[0])
+
+
+# endregion
 # region re.asub by WFLing-seaer
 async def asub(
     pattern: re.Pattern,